@@ -6,6 +6,7 @@ import configparser
 
 
 # --- Imports modules ---
+from modules.module_backgroundLoader import BackgroundResource, start_readiness_probe
 from modules.model_embbeding import Embedding
 from modules.module_vocabulary import Vocabulary
 from modules.module_languageModel import LanguageModel
@@ -25,80 +26,120 @@ cfg.read('tool.cfg')
 
 LANGUAGE            = cfg['INTERFACE']['language']
 EMBEDDINGS_PATH     = cfg['WORD_EXPLORER']['embeddings_path']
+EMBEDDINGS_LIMIT    = cfg['WORD_EXPLORER'].getint('embeddings_limit', 100000) or None
+EMBEDDINGS_STORAGE  = cfg['WORD_EXPLORER'].get('embeddings_storage', 'float32')
+SHARED_MEMORY_NAME  = cfg['WORD_EXPLORER'].get('shared_memory_name', '') or None
 NN_METHOD           = cfg['WORD_EXPLORER']['nn_method']
 MAX_NEIGHBORS       = int(cfg['WORD_EXPLORER']['max_neighbors'])
+ANN_TARGET_RECALL   = float(cfg['WORD_EXPLORER'].get('ann_target_recall', '') or 0) or None
+IVF_NPROBE          = cfg['WORD_EXPLORER'].getint('ivf_nprobe', 8)
+IVF_PQ_M            = cfg['WORD_EXPLORER'].getint('ivf_pq_m', 0) or None
+NEIGHBORS_CACHE_SIZE = cfg['WORD_EXPLORER'].getint('neighbors_cache_size', 1024)
 CONTEXTS_DATASET    = cfg['DATA']['contexts_dataset']
 VOCABULARY_SUBSET   = cfg['DATA']['vocabulary_subset']
 AVAILABLE_WORDCLOUD = cfg['DATA'].getboolean('available_wordcloud')
 LANGUAGE_MODEL      = cfg['LMODEL']['language_model']
 AVAILABLE_LOGS      = cfg['LOGS'].getboolean('available_logs')
-
-
-# --- Init classes ---
-embedding = Embedding(
-    path=EMBEDDINGS_PATH,
-    limit=100000,
-    randomizedPCA=False,
-    max_neighbors=MAX_NEIGHBORS,
-    nn_method=NN_METHOD
-)
-vocabulary = Vocabulary(
-    subset_name=VOCABULARY_SUBSET
-)
-beto_lm = LanguageModel(
-    model_name=LANGUAGE_MODEL
-)
-
-labels_path = f"language/{LANGUAGE}.json"
-if not os.path.isfile(labels_path):
-    raise FileNotFoundError(labels_path)
-labels = pd.read_json(labels_path)["app"]
-
-
-# --- Main App ---
-INTERFACE_LIST = [
-    interface_biasWordExplorer(
-        embedding=embedding,
-        available_logs=AVAILABLE_LOGS,
-        lang=LANGUAGE),
-    interface_wordExplorer(
-        embedding=embedding,
-        available_logs=AVAILABLE_LOGS,
+# Each process on a host needs its own port, EDIA_READINESS_PORT overrides it
+READINESS_PORT      = int(os.environ.get('EDIA_READINESS_PORT', '') or cfg.getint('SERVER', 'readiness_port', fallback=0))
+
+
+# The loaders start processes that import this module again, only the
+# main process builds and serves the app
+if __name__ == '__main__':
+    # --- Init classes ---
+    # Resources are loaded concurrently in background, so the interface is
+    # served right away. Each tab reports that its resource is still loading
+    # until it's ready
+    embedding = BackgroundResource(
+        'embedding',
+        Embedding,
+        path=EMBEDDINGS_PATH,
+        limit=EMBEDDINGS_LIMIT,
+        randomizedPCA=False,
         max_neighbors=MAX_NEIGHBORS,
-        lang=LANGUAGE),
-    interface_data(
-        vocabulary=vocabulary,
-        contexts=CONTEXTS_DATASET,
-        available_logs=AVAILABLE_LOGS,
-        available_wordcloud=AVAILABLE_WORDCLOUD,
-        lang=LANGUAGE),
-    interface_biasPhrase(
-        language_model=beto_lm,
-        available_logs=AVAILABLE_LOGS,
-        lang=LANGUAGE),
-    interface_crowsPairs(
-        language_model=beto_lm,
-        available_logs=AVAILABLE_LOGS,
-        lang=LANGUAGE),
-]
-
-TAB_NAMES = [
-    labels["biasWordExplorer"],
-    labels["wordExplorer"],
-    labels["dataExplorer"],
-    labels["phraseExplorer"],
-    labels["crowsPairsExplorer"]
-]
-
-if LANGUAGE != 'es':
-    # Skip data tab when using other than spanish language
-    INTERFACE_LIST = INTERFACE_LIST[:2] + INTERFACE_LIST[3:]
-    TAB_NAMES = TAB_NAMES[:2] + TAB_NAMES[3:]
-
-iface = gr.TabbedInterface(
-    interface_list= INTERFACE_LIST,
-    tab_names=TAB_NAMES
-)
-
-iface.queue(concurrency_count=8)
-iface.launch(debug=False)
+        nn_method=NN_METHOD,
+        neighbors_cache_size=NEIGHBORS_CACHE_SIZE,
+        storage=EMBEDDINGS_STORAGE,
+        shared_memory_name=SHARED_MEMORY_NAME,
+        nn_params={
+            'ann': {'target_recall': ANN_TARGET_RECALL},
+            'ivf': {'nprobe': IVF_NPROBE, 'pq_m': IVF_PQ_M}
+        }
+    )
+    vocabulary = BackgroundResource(
+        'vocabulary',
+        Vocabulary,
+        subset_name=VOCABULARY_SUBSET
+    )
+    beto_lm = BackgroundResource(
+        'language model',
+        LanguageModel,
+        model_name=LANGUAGE_MODEL
+    )
+
+    if READINESS_PORT:
+        start_readiness_probe(
+            resources={
+                'embedding': embedding,
+                'vocabulary': vocabulary,
+                'language_model': beto_lm
+            },
+            port=READINESS_PORT
+        )
+
+    labels_path = f"language/{LANGUAGE}.json"
+    if not os.path.isfile(labels_path):
+        raise FileNotFoundError(labels_path)
+    labels = pd.read_json(labels_path)["app"]
+
+
+    # --- Main App ---
+    INTERFACE_LIST = [
+        interface_biasWordExplorer(
+            embedding=embedding,
+            available_logs=AVAILABLE_LOGS,
+            lang=LANGUAGE,
+            vocabulary=vocabulary),
+        interface_wordExplorer(
+            embedding=embedding,
+            available_logs=AVAILABLE_LOGS,
+            max_neighbors=MAX_NEIGHBORS,
+            lang=LANGUAGE,
+            nn_method=NN_METHOD),
+        interface_data(
+            vocabulary=vocabulary,
+            contexts=CONTEXTS_DATASET,
+            available_logs=AVAILABLE_LOGS,
+            available_wordcloud=AVAILABLE_WORDCLOUD,
+            lang=LANGUAGE),
+        interface_biasPhrase(
+            language_model=beto_lm,
+            available_logs=AVAILABLE_LOGS,
+            lang=LANGUAGE),
+        interface_crowsPairs(
+            language_model=beto_lm,
+            available_logs=AVAILABLE_LOGS,
+            lang=LANGUAGE),
+    ]
+
+    TAB_NAMES = [
+        labels["biasWordExplorer"],
+        labels["wordExplorer"],
+        labels["dataExplorer"],
+        labels["phraseExplorer"],
+        labels["crowsPairsExplorer"]
+    ]
+
+    if LANGUAGE != 'es':
+        # Skip data tab when using other than spanish language
+        INTERFACE_LIST = INTERFACE_LIST[:2] + INTERFACE_LIST[3:]
+        TAB_NAMES = TAB_NAMES[:2] + TAB_NAMES[3:]
+
+    iface = gr.TabbedInterface(
+        interface_list= INTERFACE_LIST,
+        tab_names=TAB_NAMES
+    )
+
+    iface.queue(concurrency_count=8)
+    iface.launch(debug=False)
@@ -8,7 +8,8 @@ from modules.module_connection import BiasWordExplorerConnector
 def interface(
     embedding, # Class Embedding instance
     available_logs: bool,
-    lang: str="es"
+    lang: str="es",
+    vocabulary=None # Class Vocabulary instance, to filter the vocabulary ranking by frequency
 ) -> gr.Blocks:
 
     # -- Load examples ---
@@ -21,6 +22,7 @@ def interface(
     # --- Init vars ---
     connector = BiasWordExplorerConnector(
         embedding=embedding,
+        vocabulary=vocabulary,
         lang=lang,
         logs_file_name = f"logs_edia_we_wordbias_{lang}" if available_logs else None
     )
@@ -80,6 +82,16 @@ def interface(
                     bias4d = gr.Button(
                         value=labels["plot4SpacesButton"]
                     )
+                with gr.Row():
+                    min_freq = gr.Number(
+                        value=0,
+                        precision=0,
+                        label=labels["minFreq"],
+                        visible=vocabulary is not None
+                    )
+                    bias_vocabulary = gr.Button(
+                        value=labels["plotVocabularyButton"]
+                    )
                 with gr.Row():
                     err_msg = gr.Markdown(
                         label="", 
@@ -128,4 +140,10 @@ def interface(
             outputs=[bias_plot, err_msg]
         )
 
+        bias_vocabulary.click(
+            fn=connector.calculate_vocabulary_bias_2d,
+            inputs=[wordlist_1, wordlist_2, min_freq],
+            outputs=[bias_plot, err_msg]
+        )
+
     return interface
@@ -11,6 +11,7 @@ def interface(
     available_logs: bool, 
     max_neighbors: int,
     lang: str="es",
+    nn_method: str=None
 ) -> gr.Blocks:
 
     # -- Load examples ---
@@ -24,7 +25,8 @@ def interface(
     connector = WordExplorerConnector(
         embedding=embedding,
         lang=lang,
-        logs_file_name=f"logs_edia_we_wordexplorer_{lang}" if available_logs else None
+        logs_file_name=f"logs_edia_we_wordexplorer_{lang}" if available_logs else None,
+        nn_method=nn_method
     )
 
     # --- Load language ---
@@ -1,10 +1,20 @@
-from modules.module_ann import Ann
+from modules.module_neighborsBackends import NN_BACKENDS, NeighborsBackend, get_backend
+from modules.module_neighborsCache import NeighborsCache
+from modules.module_embeddingArtifact import EmbeddingArtifact
+from modules.module_sharedStore import SharedEmbeddingStore
+from modules.module_quantization import AVAILABLE_STORAGES, quantize, dequantize
 from memory_profiler import profile
-from sklearn.neighbors import NearestNeighbors
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 from gensim.models import KeyedVectors
-from typing import List, Any
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Tuple
 import os
+import sys
+import atexit
+import threading
 import pandas as pd
 
 import numpy as np
@@ -12,30 +22,263 @@ from numpy import dot
 from gensim import matutils
 
 
+def _read_range(
+    path: str,
+    start: int,
+    end: int
+) -> bytes:
+
+    with open(path, 'rb') as f_in:
+        f_in.seek(start)
+        return f_in.read(end - start)
+
+def _count_lines(
+    path: str,
+    start: int,
+    end: int
+) -> int:
+
+    data = _read_range(path, start, end)
+    return data.count(b'\n') + (0 if not data or data.endswith(b'\n') else 1)
+
+def _parse_vec_range(
+    path: str,
+    start: int,
+    end: int,
+    out: np.ndarray
+) -> List[str]:
+
+    # Parse the lines in the [start, end) byte range into the rows of out,
+    # stopping once out is full
+    text = _read_range(path, start, end).decode('utf-8', errors='ignore')
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    lines = lines[:out.shape[0]]
+
+    words, weights = [], []
+    for line in lines:
+        parts = line.rstrip().split(' ')
+        if len(parts) != out.shape[1] + 1:
+            raise ValueError(f"invalid vector on line '{parts[0]}' of {path}")
+        words.append(parts[0])
+        weights.extend(parts[1:])
+
+    out[:len(words)] = np.array(weights, dtype=np.float32).reshape(len(words), out.shape[1])
+    return words
+
+def _parse_vec_range_shared(
+    path: str,
+    start: int,
+    end: int,
+    shm_name: str,
+    shape: Tuple[int, int],
+    row: int,
+    n_rows: int
+) -> List[str]:
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    matrix = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    try:
+        return _parse_vec_range(path, start, end, matrix[row:row + n_rows])
+    finally:
+        # The buffer can't be closed while a view on it is alive
+        del matrix
+        shm.close()
+
+def _pool_context(
+) -> multiprocessing.context.BaseContext:
+
+    # Forking is unsafe once other threads run (e.g. the background loaders),
+    # so workers are started from a clean server process instead. It imports
+    # this module once, so that each worker doesn't import it again
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+def _pool_is_safe(
+) -> bool:
+
+    # Workers run the main script again, which they can't when it isn't a
+    # file (e.g. piped to the interpreter)
+    main_path = getattr(sys.modules.get('__main__'), '__file__', None)
+    return main_path is None or os.path.isfile(main_path)
+
+def _load_vec_pool(
+    path: str,
+    ranges: List[Tuple[int, int]],
+    n_rows: int,
+    dim: int,
+    n_jobs: int
+) -> Tuple[List[str], np.ndarray]:
+
+    shm = shared_memory.SharedMemory(create=True, size=max(n_rows * dim * 4, 1))
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=_pool_context()) as pool:
+            # First row of each range, from the lines count of the previous ones
+            counts = list(pool.map(_count_lines, *zip(*[(path, s, e) for s, e in ranges])))
+            rows = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+            futures = [
+                pool.submit(
+                    _parse_vec_range_shared, path, start, end,
+                    shm.name, (n_rows, dim), int(row), int(min(count, n_rows - row))
+                )
+                for (start, end), row, count in zip(ranges, rows, counts)
+                if row < n_rows
+            ]
+            words = [word for future in futures for word in future.result()]
+
+        vectors = np.ndarray((n_rows, dim), dtype=np.float32, buffer=shm.buf)[:len(words)].copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return words, vectors
+
+def load_vec(
+    path: str,
+    limit: int=None,
+    n_jobs: int=-1,
+    chunk_bytes: int=1 << 26,
+    min_parallel_bytes: int=1 << 28
+) -> Tuple[List[str], np.ndarray]:
+
+    """Parse a word2vec text (.vec) file, in parallel when it's large.
+    The file is split in byte ranges on newline boundaries, that are parsed
+    by a process pool straight into a shared float32 matrix. If the pool
+    can't run, the file is parsed in this process.
+    :param str path: Path to the .vec file
+    :param int limit: Max number of vectors to read from the start of the file
+    :param int n_jobs: Number of processes, -1 to use all the CPUs
+    :param int chunk_bytes: Approximate size of each byte range
+    :param int min_parallel_bytes: Smaller files are parsed in this process
+    :return: The words and the (n, d) float32 matrix of vectors
+    """
+
+    # A pool worker that runs an unguarded main script again gets here. It
+    # must neither parse the file nor go on with the script, so it fails and
+    # the caller falls back to the serial parse
+    if getattr(multiprocessing.current_process(), '_inheriting', False):
+        raise RuntimeError("load_vec was called while a worker process imported the main module")
+
+    with open(path, 'rb') as f_in:
+        header = f_in.readline()
+        data_start = f_in.tell()
+        data_end = os.fstat(f_in.fileno()).st_size
+
+        vocab_size, dim = (int(x) for x in header.split())
+        n_rows = vocab_size if limit is None else min(limit, vocab_size)
+
+        # Byte offset where the limit-th line ends
+        if n_rows < vocab_size:
+            seen = 0
+            while seen < n_rows:
+                line = f_in.readline()
+                if not line:
+                    break
+                seen += 1
+            data_end = f_in.tell()
+
+        # Byte ranges of about chunk_bytes, snapped to the next newline
+        bounds = [data_start]
+        while bounds[-1] < data_end:
+            f_in.seek(min(bounds[-1] + chunk_bytes, data_end))
+            f_in.readline()
+            bounds.append(min(f_in.tell(), data_end))
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    if n_jobs > 1 and len(ranges) > 1 and data_end - data_start >= min_parallel_bytes and _pool_is_safe():
+        try:
+            return _load_vec_pool(path, ranges, n_rows, dim, n_jobs)
+        except BrokenProcessPool:
+            print(f"WARN: The parallel parse of {path} failed, parsing it in a single process.",
+                  "Scripts that load embeddings need an 'if __name__ == \"__main__\"' guard to parse them in parallel")
+
+    vectors = np.empty((n_rows, dim), dtype=np.float32)
+    words = _parse_vec_range(path, data_start, data_end, vectors)
+    return words, vectors[:len(words)]
+
+
+
 class Embedding:
+    # Above this many vectors, PCA is fitted incrementally by default
+    INCREMENTAL_PCA_MIN_ROWS = 500000
+
     def __init__(self, 
         path: str, 
         limit: int=None,
         randomizedPCA: bool=False,
+        incrementalPCA: bool=None,
+        mergeCased: bool=False,
         max_neighbors: int=20,
-        nn_method: str='sklearn'
+        nn_method: str='sklearn',
+        use_artifact: bool=True,
+        ann_on_disk_build: bool=False,
+        dot_chunk_size: int=None,
+        neighbors_cache_size: int=1024,
+        storage: str='float32',
+        rerank: bool=True,
+        shared_memory_name: str=None,
+        nn_params: Dict[str, Dict[str, Any]]=None
     ) -> None:
 
         # Embedding vars
         self.path = path
         self.limit = limit
         self.randomizedPCA = randomizedPCA
+        self.incrementalPCA = incrementalPCA     # None to decide it by the number of vectors
+        self.mergeCased = mergeCased
         self.max_neighbors = max_neighbors
-
-        self.availables_nn_methods = ['sklearn', 'ann']
+        self.use_artifact = use_artifact
+        self.ann_on_disk_build = ann_on_disk_build
+        self.dot_chunk_size = dot_chunk_size
+        self.storage = storage
+        self.rerank = rerank
+        self.shared_memory_name = shared_memory_name
+        self.nn_params = nn_params or {}   # Extra parameters of each nn_method backend, by name
+
+        self.availables_nn_methods = list(NN_BACKENDS)
         self.nn_method = nn_method
         
-        # Full embedding dataset 
-        self.ds = None
-
-        # Estimate NearestNeighbors
-        self.ann = None     # Aproximate with Annoy method
-        self.neigh = None   # Exact with Sklearn method
+        # Full embedding dataset, stored as contiguous arrays:
+        #   words:   (V,) array of str
+        #   vectors: (V, d) matrix of normalized embeddings, in the 'storage' dtype
+        #   scales:  (V,) float32 per-row scales of the vectors, only for int8 storage
+        #   pca:     (V, 2) float32 matrix of 2d coordinates
+        self.words = None
+        self.vectors = None
+        self.scales = None
+        self.pca = None
+        self.__ds = None
+
+        # Full precision vectors mapped from the artifact, used to re-rank
+        # neighbors when the vectors are stored compressed
+        self.full_vectors = None
+
+        # Binary cache of the prepared dataset and its indexes
+        self.artifact = None
+
+        # Shared memory segment the arrays are read from, if any
+        self.shared_store = None
+
+        # Word -> row index lookup table, built once at load time
+        self.word2id = None
+
+        # Estimate NearestNeighbors, with a backend by nn_method, built
+        # when first used. Each one has a lock, so that concurrent first
+        # requests wait for a single build
+        self.backends = {}
+        self.__backends_locks = {}
+        self.__backends_lock = threading.Lock()
+
+        # LRU cache of the nearest neighbors queries
+        self.neighbors_cache = NeighborsCache(
+            max_size=neighbors_cache_size
+        )
 
         # Load embedding and pca dataset
         self.__load()
@@ -47,36 +290,205 @@ class Embedding:
         #assert(self.nn_method in self.availables_nn_methods), f"Error: The value of the parameter 'nn method' can only be {self.availables_nn_methods}!"
         if self.nn_method not in self.availables_nn_methods:
             raise ValueError(f"'nn method' parameter possible values are {self.availables_nn_methods}")
-        
-        print(f"Preparing {os.path.basename(self.path)} embeddings...")
+        elif self.storage not in AVAILABLE_STORAGES:
+            raise ValueError(f"'storage' parameter possible values are {AVAILABLE_STORAGES}")
 
+        # Cached neighbors belong to the previous space, if any
+        self.neighbors_cache.clear()
+        
         # --- Prepare dataset ---
-        self.ds = self.__preparate(
-            self.path, self.limit, self.randomizedPCA
-        )
-
-        # --- Estimate Nearest Neighbors
-        if self.nn_method == 'sklearn':
-            # Method A: Througth Sklearn method
-            self.__init_sklearn_method(
-                max_neighbors=self.max_neighbors,
-                vectors=self.ds['embedding'].to_list()
+        if self.shared_memory_name is not None:
+            self.__attachSharedMemory(self.shared_memory_name)
+        else:
+            self.words, self.vectors, self.pca = self.__loadOrPreparate(
+                self.path, self.limit, self.randomizedPCA
             )
-        
-        elif self.nn_method == 'ann':
-            # Method B: Througth annoy using forest tree
-            self.__init_ann_method(
-                words=self.ds['word'].to_list(), 
-                vectors=self.ds['embedding'].to_list(), 
-                coord=self.ds['pca'].to_list()
+
+        # --- Compress vectors ---
+        if self.storage != 'float32' and self.shared_store is None:
+            self.vectors, self.scales, self.full_vectors = self.__compress(
+                self.vectors
             )
+
+        # --- Build word index ---
+        self.word2id = {word: idx for idx, word in enumerate(self.words)}
+
+        # --- Estimate Nearest Neighbors
+        self.warm()
+
+    @property
+    def ds(
+        self
+    ) -> pd.DataFrame:
+
+        # DataFrame view of the embedding, only built when requested
+        if self.__ds is None:
+            self.__ds = pd.DataFrame({
+                'word': self.words,
+                'embedding': list(self.__fullMatrix()),
+                'pca': list(self.pca)
+            })
+        return self.__ds
     
+    def __attachSharedMemory(
+        self,
+        name: str
+    ) -> None:
+
+        print(f"Attaching {os.path.basename(self.path)} embeddings from the '{name}' shared memory segment...")
+        self.shared_store = SharedEmbeddingStore.attach(name)
+        atexit.register(self.close)
+
+        self.storage = self.shared_store.meta.get('storage', 'float32')
+        self.words = self.shared_store.words()
+        self.vectors = self.shared_store.get('vectors')
+        self.scales = self.shared_store.get('scales')
+        self.pca = self.shared_store.get('pca')
+
+        # The artifact of the loader process, if it's there, holds the indexes
+        # (mapped by every attached process instead of built in each one) and
+        # the full precision vectors to re-rank with
+        if self.use_artifact:
+            artifact = EmbeddingArtifact(
+                source_path=self.path,
+                limit=self.limit,
+                params=self.__artifactParams()
+            )
+            if artifact.isValid():
+                self.artifact = artifact
+                if self.storage != 'float32':
+                    self.full_vectors = self.artifact.loadArray('vectors', mmap_mode='r')
+
+    def shareMemory(
+        self,
+        name: str
+    ) -> SharedEmbeddingStore:
+
+        """Copy the embedding arrays into a new named shared memory segment,
+        for other processes to attach to it with shared_memory_name. 
+        The caller must detach() the returned store when serving is over.
+        """
+
+        arrays = {'vectors': self.vectors, 'pca': self.pca}
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+
+        return SharedEmbeddingStore.create(
+            name,
+            self.words,
+            arrays,
+            storage=self.storage,
+            source=os.path.basename(self.path)
+        )
+
+    def close(
+        self
+    ) -> None:
+
+        """Detach from the shared memory segment, if attached. The embedding
+        can't be used after it."""
+        if self.shared_store is not None:
+            self.words = self.vectors = self.scales = self.pca = None
+            self.backends = {}
+            self.neighbors_cache.clear()
+            self.shared_store.detach()
+            self.shared_store = None
+
+    def __compress(
+        self,
+        vectors: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+        print(f"Compressing embeddings to {self.storage}...")
+        codes_name, scales_name = f"vectors_{self.storage}", f"scales_{self.storage}"
+
+        if self.artifact is not None and self.artifact.hasArray(codes_name):
+            codes = self.artifact.loadArray(codes_name, mmap_mode='r')
+            scales = None
+            if self.artifact.hasArray(scales_name):
+                scales = self.artifact.loadArray(scales_name, mmap_mode='r')
+        else:
+            codes, scales = quantize(vectors, self.storage)
+            if self.artifact is not None:
+                try:
+                    self.artifact.saveArray(codes_name, codes)
+                    if scales is not None:
+                        self.artifact.saveArray(scales_name, scales)
+                except OSError as e:
+                    print(f"Can't save the compressed vectors in {self.artifact.artifact_dir}: {e}")
+
+        # Full precision vectors are only kept when they are mapped from the
+        # artifact, so that they don't take resident memory until read
+        full_vectors = vectors if isinstance(vectors, np.memmap) else None
+        return codes, scales, full_vectors
+
+    def __vectorRows(
+        self,
+        ids: Any
+    ) -> np.ndarray:
+
+        if self.scales is None and self.vectors.dtype == np.float32:
+            return self.vectors[ids]
+        return dequantize(
+            self.vectors[ids], 
+            self.scales[ids] if self.scales is not None else None
+        )
+
+    def __fullMatrix(
+        self
+    ) -> np.ndarray:
+
+        # Float32 (V, d) matrix, to feed the indexes that keep their own copy
+        if self.full_vectors is not None:
+            return self.full_vectors
+        return self.__vectorRows(slice(None))
+
+    def __artifactParams(
+        self
+    ) -> Dict[str, Any]:
+
+        # Preparation options the artifact content depends on
+        return {
+            'randomizedPCA': self.randomizedPCA,
+            'incrementalPCA': self.incrementalPCA,
+            'mergeCased': self.mergeCased
+        }
+
+    def __loadOrPreparate(
+        self,
+        path: str,
+        limit: int,
+        randomizedPCA: bool
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+        if not self.use_artifact:
+            print(f"Preparing {os.path.basename(path)} embeddings...")
+            return self.__preparate(path, limit, randomizedPCA)
+
+        artifact = self.artifact = EmbeddingArtifact(
+            source_path=path,
+            limit=limit,
+            params=self.__artifactParams()
+        )
+
+        if artifact.isValid():
+            print(f"Loading {os.path.basename(path)} embeddings from {artifact.artifact_dir}...")
+            return artifact.load(mmap_mode='r')
+
+        print(f"Preparing {os.path.basename(path)} embeddings...")
+        words, vectors, pca = self.__preparate(path, limit, randomizedPCA)
+        try:
+            artifact.save(words, vectors, pca)
+        except OSError as e:
+            print(f"Can't save the embedding artifact in {artifact.artifact_dir}: {e}")
+        return words, vectors, pca
+
     def __preparate(
         self, 
         path: str,
         limit: int,
         randomizedPCA: bool
-    ) -> pd.DataFrame:
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
 
         if not os.path.isfile(path):
             raise FileNotFoundError(path)
@@ -95,69 +507,204 @@ class Embedding:
                 n_components=2
             )
 
-        try:
-            model = KeyedVectors.load_word2vec_format(
-                    fname=path, 
-                    binary=path.endswith('.bin'), 
-                    limit=limit,
-                    unicode_errors='ignore'
-                )
-        except:
-            raise TypeError(f"Can't load {path} file. If it's .bin extended, only Gensim c binary format is valid")
+        if path.endswith('.bin'):
+            try:
+                model = KeyedVectors.load_word2vec_format(
+                        fname=path, 
+                        binary=True, 
+                        limit=limit,
+                        unicode_errors='ignore'
+                    )
+            except Exception as e:
+                raise TypeError(f"Can't load {path} file. If it's .bin extended, only Gensim c binary format is valid") from e
+            cased_words, cased_emb = model.index_to_key, model.vectors
+        else:
+            # Parse errors of .vec files reach the caller as they are
+            cased_words, cased_emb = load_vec(
+                path=path,
+                limit=limit
+            )
 
         # Cased Vocab
-        cased_words = model.index_to_key
-        cased_emb = model.get_normed_vectors()
-        cased_pca = pca.fit_transform(cased_emb)
-
-        df_cased = pd.DataFrame(
-            zip(
-                cased_words,
-                cased_emb,
-                cased_pca
-            ),
-            columns=['word', 'embedding', 'pca']
+        cased_words = np.array(cased_words, dtype=object)
+        cased_emb = np.ascontiguousarray(cased_emb, dtype=np.float32)
+        norms = np.linalg.norm(cased_emb, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        cased_emb /= norms
+
+        incrementalPCA = self.incrementalPCA
+        if incrementalPCA is None:
+            incrementalPCA = len(cased_words) > self.INCREMENTAL_PCA_MIN_ROWS
+
+        if incrementalPCA:
+            cased_pca = self.__incrementalPCA(cased_emb)
+        else:
+            cased_pca = pca.fit_transform(cased_emb).astype(np.float32)
+
+        # Uncased Vocab
+        return self.__uncase(cased_words, cased_emb, cased_pca)
+
+    def __uncase(
+        self,
+        cased_words: np.ndarray,
+        cased_emb: np.ndarray,
+        cased_pca: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+        # Group the lowercased words with a hash table. Groups are numbered
+        # in order of first occurrence, so uniques keeps the file order
+        codes, uniques = pd.factorize(
+            pd.Series(cased_words, dtype=object).str.lower(), sort=False
         )
+        words = np.asarray(uniques, dtype=object)
+
+        # Row of the first occurrence of each group, indexed by code
+        rows = np.arange(len(codes))
+        first = np.unique(codes, return_index=True)[1]
+
+        dup = np.ones(len(codes), dtype=bool)
+        dup[first] = False
+        if not self.mergeCased or not dup.any():
+            return words, cased_emb[first], cased_pca[first]
+
+        # Average the cased variants of each word. Files are sorted by
+        # frequency, so Zipf's law 1/rank is used as the frequency weight
+        weights = (1 / (rows + 1.0)).astype(np.float32)
+        dup_rows = rows[dup][np.argsort(codes[dup], kind='stable')]
+        dup_codes, starts = np.unique(codes[dup_rows], return_index=True)
+
+        def weighted_sum(matrix: np.ndarray) -> np.ndarray:
+            # Sum the weighted rows of each word, first occurrence included
+            out = matrix[first] * weights[first][:, None]
+            out[dup_codes] += np.add.reduceat(
+                matrix[dup_rows] * weights[dup_rows][:, None], starts, axis=0
+            )
+            return out
 
-        df_cased['word'] = df_cased.word.apply(lambda w: w.lower())
-        df_uncased = df_cased.drop_duplicates(subset='word')
-        return df_uncased
+        total = weights[first].copy()
+        total[dup_codes] += np.add.reduceat(weights[dup_rows], starts)
 
-    def __init_ann_method(
-        self, 
-        words: List[str],
-        vectors: List[float],
-        coord: List[float], 
-        n_trees: int=20,
-        metric: str='dot'
-    ) -> None:
+        vectors = weighted_sum(cased_emb)
+        coords = weighted_sum(cased_pca) / total[:, None]
 
-        print("Initializing Annoy method to search for nearby neighbors...")
-        self.ann = Ann(
-            words=words,
-            vectors=vectors,
-            coord=coord,
-        )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        vectors /= norms
+        return words, vectors, coords
 
-        self.ann.init(
-            n_trees=n_trees, 
-            metric=metric, 
-            n_jobs=-1
-        )
-    
-    def __init_sklearn_method(
+    def __incrementalPCA(
         self,
-        max_neighbors: int,
-        vectors: List[float]
-    ) -> None:
-        
-        print("Initializing sklearn method to search for nearby neighbors...")
-        self.neigh = NearestNeighbors(
-            n_neighbors=max_neighbors
-        )
-        self.neigh.fit(
-            X=vectors
-        )
+        vectors: np.ndarray,
+        batch_size: int=65536
+    ) -> np.ndarray:
+
+        # Fit and project by batches, so that no dense copy of the whole
+        # matrix is made. Batches are evenly sized, to never get one smaller
+        # than n_components
+        n_batches = max(1, -(-vectors.shape[0] // batch_size))
+        bounds = np.linspace(0, vectors.shape[0], n_batches + 1, dtype=np.int64)
+        batches = list(zip(bounds[:-1], bounds[1:]))
+
+        pca = IncrementalPCA(n_components=2)
+        for start, stop in batches:
+            pca.partial_fit(vectors[start:stop])
+
+        coords = np.empty((vectors.shape[0], 2), dtype=np.float32)
+        for start, stop in batches:
+            coords[start:stop] = pca.transform(vectors[start:stop])
+        return coords
+
+    def __backendParams(
+        self,
+        nn_method: str
+    ) -> Dict[str, Any]:
+
+        # Defaults from the embedding options, overridden by nn_params
+        defaults = {
+            'sklearn': {'max_neighbors': self.max_neighbors},
+            'ann': {'n_trees': 20, 'metric': 'dot', 'on_disk_build': self.ann_on_disk_build,
+                    'words': self.words.tolist(), 'coord': self.pca},
+            'dot': {'chunk_size': self.dot_chunk_size},
+            'graph': {'chunk_size': self.dot_chunk_size, 'max_neighbors': self.max_neighbors}
+        }
+        return {**defaults.get(nn_method, {}), **self.nn_params.get(nn_method, {})}
+
+    def getBackend(
+        self,
+        nn_method: str
+    ) -> NeighborsBackend:
+
+        """Get the nn_method backend, loading it from the artifact or
+        building it the first time. Thread-safe: only one thread builds a
+        given backend, the others wait for it."""
+        backend = self.backends.get(nn_method, None)
+        if backend is not None:
+            return backend
+
+        backend_class = get_backend(nn_method)
+        with self.__backends_lock:
+            lock = self.__backends_locks.setdefault(nn_method, threading.Lock())
+
+        with lock:
+            # Built by another thread while this one was waiting
+            backend = self.backends.get(nn_method, None)
+            if backend is None:
+                backend = self.__buildBackend(nn_method, backend_class)
+                self.backends[nn_method] = backend
+        return backend
+
+    def __buildBackend(
+        self,
+        nn_method: str,
+        backend_class: type
+    ) -> NeighborsBackend:
+
+        if backend_class.COMPRESSED:
+            inputs = (self.vectors, self.scales, self.full_vectors if self.rerank else None)
+        else:
+            if self.storage != 'float32' and self.full_vectors is None:
+                print(f"WARN: The {nn_method} method keeps a float32 copy of the vectors, that takes more memory",
+                      f"than the {self.storage} storage saves. Use the 'dot' or 'graph' method, or the embedding",
+                      "artifact to map the float32 vectors from disk")
+            inputs = (self.__fullMatrix(), None, None)
+        backend = backend_class(*inputs, **self.__backendParams(nn_method))
+
+        if self.artifact is None or not backend.load(self.artifact):
+            backend.build(self.artifact)
+            if self.artifact is not None:
+                try:
+                    backend.save(self.artifact)
+                except OSError as e:
+                    print(f"Can't save the {nn_method} index in {self.artifact.artifact_dir}: {e}")
+
+        return backend
+
+    def warm(
+        self,
+        nn_methods: List[str]=None
+    ) -> 'Embedding':
+
+        """Build or load the nn_methods backends (the default nn_method one
+        if not given) ahead of the first request, and run a query through
+        each, so that their memory mapped files are paged in.
+        :return: The embedding itself, so that it can follow the constructor
+        """
+
+        for nn_method in nn_methods or [self.nn_method]:
+            self.getBackend(nn_method)
+            if len(self.words) > 1:
+                self.__kneighbors(np.array([0]), 1, nn_method)
+        return self
+
+    def __getRows(
+        self,
+        feature: str,
+        ids: Any
+    ) -> np.ndarray:
+
+        if feature == 'vectors':
+            return self.__vectorRows(ids)
+        return getattr(self, feature)[ids]
 
     def __getValue(
         self, 
@@ -165,24 +712,47 @@ class Embedding:
         feature: str
     ) -> Any:
 
-        word_id, value = None, None
+        word_id, value = self.word2id.get(word, None), None
 
-        if word in self:
-            word_id = self.ds['word'].to_list().index(word)
-        
         if word_id != None:
-            value = self.ds[feature].to_list()[word_id]
+            value = self.__getRows(feature, word_id)
         else:
             print(f"The word '{word}' does not exist")
 
         return value
+
+    def __getValues(
+        self,
+        words: List[str],
+        feature: str
+    ) -> np.ndarray:
+
+        return self.__getRows(feature, self.getWordIds(words))
+
+    def getWordIds(
+        self,
+        words: List[str]
+    ) -> np.ndarray:
+
+        return np.fromiter(
+            (self.word2id[word] for word in words), 
+            dtype=np.int64, 
+            count=len(words)
+        )
     
     def getEmbedding(
         self, 
         word: str
     ) -> np.ndarray:
 
-        return self.__getValue(word, 'embedding')
+        return self.__getValue(word, 'vectors')
+
+    def getEmbeddings(
+        self,
+        words: List[str]
+    ) -> np.ndarray:
+
+        return self.__getValues(words, 'vectors')
 
     def getPCA(
         self, 
@@ -190,13 +760,19 @@ class Embedding:
     ) -> np.ndarray:
 
         return self.__getValue(word, 'pca')
+
+    def getPCAs(
+        self,
+        words: List[str]
+    ) -> np.ndarray:
+
+        return self.__getValues(words, 'pca')
     
-    def getNearestNeighbors(
-        self, 
-        word: str, 
-        n_neighbors: int=10, 
-        nn_method: str='sklearn'
-    ) -> List[str]:
+    def __checkNeighborsParams(
+        self,
+        n_neighbors: int,
+        nn_method: str
+    ) -> None:
 
         #assert(n_neighbors <= self.max_neighbors), f"Error: The value of the parameter 'n_neighbors:{n_neighbors}' must less than or equal to {self.max_neighbors}!."
 
@@ -207,33 +783,155 @@ class Embedding:
         elif nn_method not in self.availables_nn_methods:
             raise ValueError(f"'nn method' parameter possible values are {self.availables_nn_methods}")
 
-        neighbors_list = []
+    def __kneighbors(
+        self,
+        word_ids: np.ndarray,
+        n_neighbors: int,
+        nn_method: str
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        # Query the n_neighbors + 1 nearest rows of all the words at once, and
+        # return the cosine similarities and ids of each word neighbors, 
+        # the word itself excluded
+        k = n_neighbors + 1
+
+        # Full precision rows when they are mapped from the artifact
+        if self.full_vectors is not None:
+            queries = np.asarray(self.full_vectors[word_ids])
+        else:
+            queries = self.__vectorRows(word_ids)
+        nn_sims, nn_ids = self.getBackend(nn_method).batch_query_rows(word_ids, queries, k)
 
-        if word not in self:
-            print(f"The word '{word}' does not exist")
-            return neighbors_list
-
-        if nn_method == 'ann':
-            if self.ann is None:
-                self.__init_ann_method(
-                    words=self.ds['word'].to_list(), 
-                    vectors=self.ds['embedding'].to_list(), 
-                    coord=self.ds['pca'].to_list()
-                )
-            neighbors_list = self.ann.get(word, n_neighbors)
-            
-        elif nn_method == 'sklearn':
-            if self.neigh is None:
-                self.__init_sklearn_method(
-                    max_neighbors=self.max_neighbors,
-                    vectors=self.ds['embedding'].to_list()
-                )
+        sims_list, ids_list = [], []
+        for word_id, ids, sims in zip(word_ids, nn_ids, nn_sims):
+            keep = ids != word_id
+            if keep.all():
+                keep[-1] = False
+            sims_list.append(sims[keep])
+            ids_list.append(ids[keep])
+
+        return sims_list, ids_list
+
+    def getNearestNeighborsBatch(
+        self,
+        words: List[str],
+        n_neighbors: int=10,
+        nn_method: str='sklearn',
+        min_similarity: float=None
+    ) -> Tuple[List[List[str]], List[np.ndarray]]:
+
+        """Get the nearest neighbors of a list of words with a single index query.
+        :param list words: The words to get the neighbors of
+        :param int n_neighbors: Number of neighbors by word, the cap when
+                                searching by min_similarity
+        :param str nn_method: One of availables_nn_methods
+        :param float min_similarity: Keep only the neighbors with a cosine
+                                     similarity greater or equal than it
+        :return: The neighbors list and the cosine similarities array of each
+                 word, in the same order as words. Empty for unknown words
+        """
+
+        self.__checkNeighborsParams(n_neighbors, nn_method)
+
+        neighbors_lists = [[] for _ in words]
+        similarities_lists = [np.array([], dtype=np.float32) for _ in words]
+
+        known = []
+        for i, word in enumerate(words):
+            if word not in self:
+                print(f"The word '{word}' does not exist")
+                continue
+
+            cached = self.neighbors_cache.get(word, n_neighbors, nn_method)
+            if cached is not None:
+                neighbors_lists[i], similarities_lists[i] = cached
+            else:
+                known.append(i)
+
+        if known:
+            self.__queryNeighbors(words, known, n_neighbors, nn_method, neighbors_lists, similarities_lists)
+
+        if min_similarity is not None:
+            for i, sims in enumerate(similarities_lists):
+                keep = np.flatnonzero(sims >= min_similarity)
+                neighbors_lists[i] = [neighbors_lists[i][j] for j in keep]
+                similarities_lists[i] = sims[keep]
+
+        return neighbors_lists, similarities_lists
+
+    def __queryNeighbors(
+        self,
+        words: List[str],
+        known: List[int],
+        n_neighbors: int,
+        nn_method: str,
+        neighbors_lists: List[List[str]],
+        similarities_lists: List[np.ndarray]
+    ) -> None:
+
+        # Misses are queried with max_neighbors when caching, so the same
+        # entry can serve later queries with any n_neighbors
+        k = self.max_neighbors if self.neighbors_cache.max_size > 0 else n_neighbors
+        word_ids = self.getWordIds([words[i] for i in known])
+        sims_list, ids_list = self.__kneighbors(word_ids, k, nn_method)
+
+        for i, sims, ids in zip(known, sims_list, ids_list):
+            neighbors = self.words[ids].tolist()
+            self.neighbors_cache.put(words[i], k, nn_method, neighbors, sims)
+            neighbors_lists[i] = neighbors[:n_neighbors]
+            similarities_lists[i] = sims[:n_neighbors]
+    
+    def getNearestNeighbors(
+        self, 
+        word: str, 
+        n_neighbors: int=10, 
+        nn_method: str='sklearn'
+    ) -> List[str]:
+
+        neighbors_lists, _ = self.getNearestNeighborsBatch(
+            [word], n_neighbors, nn_method
+        )
+        return neighbors_lists[0]
+
+    def getNearestNeighborsSimilarities(
+        self,
+        word: str,
+        n_neighbors: int=10,
+        nn_method: str='sklearn',
+        min_similarity: float=None
+    ) -> List[Tuple[str, float]]:
+
+        """Get the (neighbor, cosine similarity) pairs of a word, by
+        decreasing similarity. With min_similarity, all the neighbors at
+        least that similar, up to n_neighbors."""
+        neighbors_lists, similarities_lists = self.getNearestNeighborsBatch(
+            [word], n_neighbors, nn_method, min_similarity
+        )
+        return list(zip(neighbors_lists[0], similarities_lists[0].tolist()))
+
+    def getProjections(
+        self,
+        direction: np.ndarray,
+        chunk_size: int=65536
+    ) -> np.ndarray:
+
+        """Cosine similarity of every word of the vocabulary with a direction.
+        A single matrix-vector product, by chunks when the vectors are
+        stored compressed.
+        :return: The (V,) float32 projections, in the words order
+        """
+
+        direction = np.asarray(direction, dtype=np.float32)
+        direction = direction / np.linalg.norm(direction)
 
-            word_emb = self.getEmbedding(word).reshape(1,-1)
-            _, nn_ids = self.neigh.kneighbors(word_emb, n_neighbors + 1)     
-            neighbors_list = [self.ds['word'].to_list()[idx] for idx in nn_ids[0]][1:]
+        if self.scales is None and self.vectors.dtype == np.float32:
+            return np.asarray(self.vectors @ direction)
 
-        return neighbors_list
+        projections = np.empty(self.vectors.shape[0], dtype=np.float32)
+        for start in range(0, self.vectors.shape[0], chunk_size):
+            rows = slice(start, start + chunk_size)
+            projections[rows] = self.__vectorRows(rows) @ direction
+        return projections
 
     def cosineSimilarities(
         self, 
@@ -262,4 +960,4 @@ class Embedding:
         word: str
     ) -> bool:
 
-        return word in self.ds['word'].to_list()
\ No newline at end of file
+        return word in self.word2id
\ No newline at end of file
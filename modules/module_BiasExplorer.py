@@ -5,11 +5,15 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from sklearn.decomposition import PCA
 from typing import List, Dict, Tuple, Optional, Any, Callable
-from modules.utils import normalize, cosine_similarity, project_params, take_two_sides_extreme_sorted, axes_labels_format
+from modules.utils import normalize, cosine_similarity, cosine_similarities, project_params, take_two_sides_extreme_sorted, axes_labels_format
+from modules.module_directionsCache import DirectionsCache
 
 __all__ = ['WordBiasExplorer', 'WEBiasExplorer2Spaces', 'WEBiasExplorer4Spaces']
 
 class WordBiasExplorer:
+    # LRU cache of the identified directions, shared by all the explorers
+    directions_cache = DirectionsCache(max_size=128)
+
     def __init__(
         self, 
         embedding,      # Embedding class instance
@@ -20,9 +24,14 @@ class WordBiasExplorer:
         self.direction = None
         self.positive_end = None
         self.negative_end = None
+        self.definitional = None
         self.DIRECTION_METHODS = ['single', 'sum', 'pca']
         self.errorManager = errorManager
 
+        # Vocabulary frequencies aligned with the embedding words, as a
+        # (vocabulary, freqs) pair, computed once by vocabulary
+        self.__aligned_freqs = None
+
     def __copy__(
         self
     ) -> 'WordBiasExplorer':
@@ -31,6 +40,7 @@ class WordBiasExplorer:
         bias_word_embedding.direction = copy.deepcopy(self.direction)
         bias_word_embedding.positive_end = copy.deepcopy(self.positive_end)
         bias_word_embedding.negative_end = copy.deepcopy(self.negative_end)
+        bias_word_embedding.definitional = copy.deepcopy(self.definitional)
         return bias_word_embedding
 
     def __deepcopy__(
@@ -107,18 +117,82 @@ class WordBiasExplorer:
             raise ValueError('positive_end and negative_end'
                              'should be different, and not the same "{}"'
                              .format(positive_end))
+
+        if method == 'single' and (len(definitional[0]) > 1 or len(definitional[1]) > 1):
+            print('WARN: Using \'single\' method to identify direction',
+                'but longer lists given to calculate bias aspect.',
+                'Using only:',
+                definitional[0][0],
+                'and',
+                definitional[1][0])
+
+        self.direction = self._get_direction(definitional, method, first_pca_threshold)
+        self.positive_end = positive_end
+        self.negative_end = negative_end
+        self.definitional = definitional
+
+    def _get_directions(
+        self,
+        definitionals: List[Tuple[List[str], List[str]]],
+        method: str='pca',
+        first_pca_threshold: float=0.5
+    ) -> np.ndarray:
+
+        """Identify a direction by definitional pair of lists, without
+        changing the explorer state.
+        :return: The (d, k) matrix with a direction by column
+        """
+
+        if method not in self.DIRECTION_METHODS:
+            raise ValueError('method should be one of {}, {} was given'.format(
+                self.DIRECTION_METHODS, method))
+
+        for definitional in definitionals:
+            if definitional[0] == definitional[1]:
+                raise ValueError('positive_end and negative_end'
+                                 'should be different, and not the same "{}"'
+                                 .format(', '.join(definitional[0])))
+
+        return np.stack([
+            self._get_direction(definitional, method, first_pca_threshold)
+            for definitional in definitionals
+        ], axis=1)
+
+    def _get_direction(
+        self,
+        definitional: Tuple[List[str], List[str]],
+        method: str='pca',
+        first_pca_threshold: float=0.5
+    ) -> np.ndarray:
+
+        # The direction doesn't depend on the order of the lists, except for
+        # the words taken by 'single' and the pairs formed by 'pca'
+        if method == 'single':
+            key = ((definitional[0][0],), (definitional[1][0],))
+        else:
+            key = (tuple(sorted(definitional[0])), tuple(sorted(definitional[1])))
+            if method == 'pca':
+                key += (tuple(sorted(zip(definitional[0], definitional[1]))), first_pca_threshold)
+        key += (method,)
+
+        direction = self.directions_cache.get(self.embedding, key)
+        if direction is None:
+            direction = self._calc_direction(definitional, method, first_pca_threshold)
+            direction = self.directions_cache.put(self.embedding, key, direction)
+        return direction
+
+    def _calc_direction(
+        self,
+        definitional: Tuple[List[str], List[str]],
+        method: str='pca',
+        first_pca_threshold: float=0.5
+    ) -> np.ndarray:
+
         direction = None
 
         if method == 'single':
             left_word_definitional = definitional[0][0]
             right_word_definitional = definitional[1][0]
-            if len(definitional[0]) > 1 or len(definitional[1]) > 1:
-                print('WARN: Using \'single\' method to identify direction',
-                    'but longer lists given to calculate bias aspect.',
-                    'Using only:',
-                    left_word_definitional,
-                    'and',
-                    right_word_definitional)
             direction = normalize(normalize(self[left_word_definitional])
                                   - normalize(self[right_word_definitional]))
 
@@ -153,9 +227,7 @@ class WordBiasExplorer:
             if ends_diff_projection < 0:
                 direction = abs(direction)
 
-        self.direction = direction
-        self.positive_end = positive_end
-        self.negative_end = negative_end
+        return direction
 
     def project_on_direction(
         self, 
@@ -174,18 +246,61 @@ class WordBiasExplorer:
                                                           [vector])[0]
         return projection_score
 
+    def project_words_on_direction(
+        self,
+        words: List[str]
+    ) -> np.ndarray:
+
+        """Project the normalized vectors of many words on the direction,
+        with a single matrix-vector product.
+        :param list words: The words to project
+        :return np.ndarray: The projection scalar of each word
+        """
+
+        self._is_direction_identified()
+        return cosine_similarities(self.embedding.getEmbeddings(words), self.direction)
+
+    def project_words_on_directions(
+        self,
+        words: List[str],
+        directions: np.ndarray,
+        projection_func: Callable[..., Any]=None
+    ) -> np.ndarray:
+
+        """Project the normalized vectors of many words on k directions at
+        once, with a single matrix-matrix product.
+        :param list words: The words to project
+        :param np.ndarray directions: (d, k) matrix with a direction by column
+        :param projection_func: Like in _calc_projection_scores, called by direction
+        :return np.ndarray: The (n, k) projection scalars of each word on each direction
+        """
+
+        if projection_func is None:
+            return cosine_similarities(self.embedding.getEmbeddings(words), directions)
+        elif getattr(projection_func, 'vectorized', False):
+            matrix = self.embedding.getEmbeddings(words)
+            return np.stack([projection_func(matrix, direction) for direction in directions.T], axis=1)
+        else:
+            return np.array([[projection_func(word, direction) for direction in directions.T]
+                             for word in words]).reshape(len(words), directions.shape[1])
+
     def _calc_projection_scores(
         self, 
         words: List[str],
-        projection_func: Callable[[str, np.ndarray], float]=None
+        projection_func: Callable[..., Any]=None
     ) -> pd.DataFrame:
 
+        """projection_func gets each word and the direction, or the words
+        matrix and the direction when marked with utils.vectorized_projection."""
+
         self._is_direction_identified()
 
         df = pd.DataFrame({'word': words})
 
         if projection_func is None:
-            df['projection'] = df['word'].apply(self.project_on_direction)
+            df['projection'] = self.project_words_on_direction(words)
+        elif getattr(projection_func, 'vectorized', False):
+            df['projection'] = projection_func(self.embedding.getEmbeddings(words), self.direction)
         else:
             df['projection'] = df['word'].apply(lambda word: projection_func(word, self.direction))
         
@@ -193,6 +308,65 @@ class WordBiasExplorer:
 
         return df
 
+    def rank_vocabulary_bias(
+        self,
+        n_extreme: int=10,
+        vocabulary=None,    # Vocabulary class instance
+        min_freq: int=None
+    ) -> pd.DataFrame:
+
+        """Project the whole embedding vocabulary on the direction, and take
+        the most extreme words of each end. The definitional words of the
+        direction, extreme by construction, are left out.
+        :param int n_extreme: The number of words to take from each end
+        :param Vocabulary vocabulary: Corpus vocabulary to filter the words by
+        :param int min_freq: Only rank the words at least this frequent in vocabulary
+        :return: :class:`pandas.DataFrame` of the words and projections, the
+                 n_extreme greatest ones followed by the n_extreme lowest ones,
+                 sorted by decreasing projection
+        """
+
+        self._is_direction_identified()
+
+        projections = self.embedding.getProjections(self.direction)
+        keep = np.ones(len(projections), dtype=bool)
+        if vocabulary is not None and min_freq is not None:
+            keep &= self.__getAlignedFreqs(vocabulary) >= min_freq
+
+        if self.definitional is not None:
+            definitional_ids = [self.embedding.word2id[word]
+                                for wordlist in self.definitional for word in wordlist
+                                if word in self.embedding.word2id]
+            keep[definitional_ids] = False
+        candidates = np.flatnonzero(keep)
+
+        scores = projections[candidates]
+        n = min(n_extreme, len(candidates))
+        if n == 0:
+            return pd.DataFrame({'word': [], 'projection': []})
+
+        # Unsorted ends first, only the 2n selected words are sorted
+        top = np.argpartition(-scores, n - 1)[:n]
+        bottom = np.argpartition(scores, n - 1)[:n]
+        ends = np.unique(np.concatenate([top, bottom]))
+        ends = ends[np.argsort(-scores[ends], kind='stable')]
+
+        return pd.DataFrame({
+            'word': self.embedding.words[candidates[ends]],
+            'projection': scores[ends]
+        })
+
+    def __getAlignedFreqs(
+        self,
+        vocabulary      # Vocabulary class instance
+    ) -> np.ndarray:
+
+        aligned_freqs = self.__aligned_freqs
+        if aligned_freqs is None or aligned_freqs[0] is not vocabulary:
+            aligned_freqs = (vocabulary, vocabulary.getFreqs(self.embedding.words))
+            self.__aligned_freqs = aligned_freqs
+        return aligned_freqs[1]
+
     def calc_projection_data(
         self, 
         words: List[str]
@@ -241,7 +415,7 @@ class WordBiasExplorer:
         for name in names:
             words = word_groups[name]
             label = '{} (#{})'.format(name, len(words))
-            vectors = [self[word] for word in words]
+            vectors = self.embedding.getEmbeddings(words)
             projections = self.embedding.cosineSimilarities(self.direction,
                                                          vectors)
             sns.distplot(projections, hist=False, label=label, ax=ax)
@@ -320,6 +494,38 @@ class WEBiasExplorer2Spaces(WordBiasExplorer):
                 projection_func=projection_func
             )
 
+    def calculate_vocabulary_bias(
+        self,
+        wordlist_right: List[str],
+        wordlist_left: List[str],
+        method: str='sum',
+        n_extreme: int=10,
+        vocabulary=None,    # Vocabulary class instance
+        min_freq: int=None
+    ) -> plt.Figure:
+
+        """Like calculate_bias, but diagnosing the whole embedding
+        vocabulary, or its words at least min_freq frequent in vocabulary."""
+
+        wordlists = [wordlist_right, wordlist_left]
+
+        for wordlist in wordlists:
+            if not wordlist:
+                raise ValueError(self.errorManager.process(['BIASEXPLORER_NOT_ENOUGH_WORD_2_KERNELS']))
+
+        err = self.check_oov(wordlists)
+        if err:
+            raise ValueError(err)
+
+        return self.get_bias_plot(
+                None,
+                definitional=(wordlist_right, wordlist_left),
+                method=method,
+                n_extreme=n_extreme,
+                vocabulary=vocabulary,
+                min_freq=min_freq
+            )
+
     def get_bias_plot(
         self,
         wordlist_to_diagnose: List[str],
@@ -327,7 +533,9 @@ class WEBiasExplorer2Spaces(WordBiasExplorer):
         method: str='sum',
         n_extreme: int=10,
         projection_func: Callable[[str, np.ndarray], float]=None,
-        figsize: Tuple[int, int]=(10, 10)
+        figsize: Tuple[int, int]=(10, 10),
+        vocabulary=None,
+        min_freq: int=None
     ) -> plt.Figure:
 
         fig, ax = plt.subplots(1, figsize=figsize)
@@ -338,7 +546,9 @@ class WEBiasExplorer2Spaces(WordBiasExplorer):
             n_extreme, 
             ax=ax,
             method=method,
-            projection_func=projection_func)
+            projection_func=projection_func,
+            vocabulary=vocabulary,
+            min_freq=min_freq)
 
         fig.tight_layout()
         fig.canvas.draw()
@@ -353,11 +563,13 @@ class WEBiasExplorer2Spaces(WordBiasExplorer):
         ax: plt.Axes=None, 
         axis_projection_step: float=None,
         method: str='sum',
-        projection_func: Callable[[str, np.ndarray], float]=None
+        projection_func: Callable[[str, np.ndarray], float]=None,
+        vocabulary=None,
+        min_freq: int=None
     ) -> plt.Axes:
 
         """Plot the projection scalar of words on the direction.
-        :param list words: The words tor project
+        :param list words: The words tor project, None for the whole vocabulary
         :param int or None n_extreme: The number of extreme words to show
         :return: The ax object of the plot
         """
@@ -370,12 +582,16 @@ class WEBiasExplorer2Spaces(WordBiasExplorer):
 
         self._is_direction_identified()
 
-        projections_df = self._calc_projection_scores(words, projection_func)
-        projections_df['projection'] = projections_df['projection'].round(2)
+        if words is None:
+            projections_df = self.rank_vocabulary_bias(n_extreme, vocabulary, min_freq)
+            projections_df['projection'] = projections_df['projection'].round(2)
+        else:
+            projections_df = self._calc_projection_scores(words, projection_func)
+            projections_df['projection'] = projections_df['projection'].round(2)
 
-        if n_extreme is not None:
-            projections_df = take_two_sides_extreme_sorted(projections_df,
-                                                           n_extreme=n_extreme)
+            if n_extreme is not None:
+                projections_df = take_two_sides_extreme_sorted(projections_df,
+                                                               n_extreme=n_extreme)
 
         if ax is None:
             _, ax = plt.subplots(1)
@@ -471,7 +687,6 @@ class WEBiasExplorer4Spaces(WordBiasExplorer):
     ) -> plt.Figure:
 
         fig, ax = plt.subplots(1, figsize=figsize)
-        self.method = method
         self.plot_projection_scores(
             definitional_1,
             definitional_2,
@@ -504,26 +719,21 @@ class WEBiasExplorer4Spaces(WordBiasExplorer):
 
         name_left = ', '.join(definitional_1[1])
         name_right = ', '.join(definitional_1[0])
-
-        self._identify_direction(name_left, name_right,
-                                 definitional=definitional_1,
-                                 method=method)
-
-        self._is_direction_identified()
-
-        projections_df = self._calc_projection_scores(words, projection_func)
-        projections_df['projection_x'] = projections_df['projection'].round(2)
-
         name_top = ', '.join(definitional_2[1])
         name_bottom = ', '.join(definitional_2[0])
-        self._identify_direction(name_top, name_bottom,
-                                 definitional=definitional_2,
-                                 method=method)
 
-        self._is_direction_identified()
+        # Both axes in a single product, without touching self.direction,
+        # so that concurrent requests can share the explorer
+        directions = self._get_directions([definitional_1, definitional_2], method)
+        projections = self.project_words_on_directions(words, directions, projection_func)
 
-        projections_df['projection_y'] = self._calc_projection_scores(words, projection_func)[
-            'projection'].round(2)
+        projections_df = pd.DataFrame({
+            'word': words,
+            'projection': projections[:, 0],
+            'projection_x': projections[:, 0].round(2),
+            'projection_y': projections[:, 1].round(2)
+        })
+        projections_df = projections_df.sort_values('projection', ascending=False)
 
         if n_extreme is not None:
             projections_df = take_two_sides_extreme_sorted(projections_df,
@@ -549,10 +759,11 @@ class WEBiasExplorer4Spaces(WordBiasExplorer):
                         y='projection_y', 
                         data=projections_df,
                         # color=list(projections_df['color'].to_list()), # No se distinguen los colores
-                        color='blue'
+                        color='blue',
+                        ax=ax
         )
 
-        plt.xticks(np.arange(-most_extream_projection,
+        ax.set_xticks(np.arange(-most_extream_projection,
                              most_extream_projection + axis_projection_step,
                              axis_projection_step))
         for _, row in (projections_df.iterrows()):
@@ -573,11 +784,11 @@ class WEBiasExplorer4Spaces(WordBiasExplorer):
             word_wrap=3
         )
 
-        plt.xlabel(x_label)
+        ax.set_xlabel(x_label)
         ax.xaxis.set_label_position('bottom')
         ax.xaxis.set_label_coords(.5, 0)
 
-        plt.ylabel(y_label)
+        ax.set_ylabel(y_label)
         ax.yaxis.set_label_position('left')
         ax.yaxis.set_label_coords(0, .5)
 
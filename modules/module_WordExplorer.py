@@ -182,31 +182,39 @@ class WordExplorer:
         n_neighbors = kwargs.get('n_neighbors', 0)
         n_alpha = kwargs.get('n_alpha', 0.3)
 
+        # Neighbors of all the words are fetched with a single index query
+        neighbors_lists = iter([])
+        if n_neighbors > 0:
+            neighbors_lists, _ = self.embedding.getNearestNeighborsBatch(
+                [word for word_list in wordlist_choice for word in word_list],
+                n_neighbors=n_neighbors,
+                nn_method=kwargs.get('nn_method', self.embedding.nn_method),
+                min_similarity=kwargs.get('min_similarity', None)
+            )
+            neighbors_lists = iter(neighbors_lists)
+
         processed_word_list = []
+        processed_words = set()
         for word_list_to_process, color in zip(wordlist_choice, choices):
             for word in word_list_to_process:
                 processed_word_list.append(
                     WordToPlot(word, color_dict[color], color, 1)
                 )
+                processed_words.add(word)
 
                 if n_neighbors > 0:
-                    neighbors = self.get_neighbors(
-                        word,
-                        n_neighbors=n_neighbors,
-                        nn_method=kwargs.get('nn_method', 'sklearn')
-                    )
-
-                    for n in neighbors:
-                        if n not in [wtp.word for wtp in processed_word_list]:
+                    for n in next(neighbors_lists):
+                        if n not in processed_words:
                             processed_word_list.append(
                                 WordToPlot(n, color_dict[color], color, n_alpha)
                             )
+                            processed_words.add(n)
 
         if not processed_word_list:
             raise ValueError(self.errorManager.process(['WORDEXPLORER_ONLY_EMPTY_LISTS']))
 
-        words_embedded = np.array(
-            [self.embedding.getPCA(wtp.word) for wtp in processed_word_list]
+        words_embedded = self.embedding.getPCAs(
+            [wtp.word for wtp in processed_word_list]
         )
 
         data = self.get_df(
@@ -237,14 +245,12 @@ class WordExplorer:
         if err:
             raise ValueError(err)
 
-        words_emb = np.array([self.embedding.getEmbedding(word)
-                             for word in wordlist])
+        words_emb = self.embedding.getEmbeddings(wordlist)
         mean_vec = np.mean(words_emb, axis=0)
 
         doesnt_match = ""
         farthest_emb = 1.0
-        for word in wordlist:
-            word_emb = self.embedding.getEmbedding(word)
+        for word, word_emb in zip(wordlist, words_emb):
             cos_sim = np.dot(mean_vec, word_emb) / (norm(mean_vec)*norm(word_emb))
             if cos_sim <= farthest_emb:
                 farthest_emb = cos_sim
@@ -1,7 +1,13 @@
+import os
 import time
-from tqdm import tqdm
+import logging
+import numpy as np
 from annoy import AnnoyIndex
-from typing import List
+from modules.module_dotNeighbors import DotNeighbors
+from typing import List, Dict, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
 
 class TicToc:
     def __init__(
@@ -17,33 +23,40 @@ class TicToc:
         self.i = time.time()
 
     def stop(
-        self
-    ) -> None:
+        self,
+        task: str=''
+    ) -> float:
 
-        f = time.time()
-        print(f - self.i, "seg.")
+        f = time.time() - self.i
+        logger.info("%s %.3f seg.", task, f)
+        return f
 
 
 class Ann:
     def __init__(
         self, 
         words: List[str], 
-        vectors: List, 
-        coord: List, 
+        vectors: np.ndarray, 
+        coord: np.ndarray, 
     ) -> None:
 
+        # The (V, d) matrix is used as is when it's already float32 and
+        # contiguous, e.g. memory mapped from the embedding artifact
         self.words = words
-        self.vectors = vectors
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
         self.coord = coord
+        self.word2id = {word: idx for idx, word in enumerate(words)} if words is not None else {}
         self.tree = None
+        self.metric = None
+        self.n_trees = None
+        self.search_k = -1     # Nodes inspected by query, -1 for annoy default of n_trees * n_neighbors
 
         self.tt = TicToc()
         self.availables_metrics = ['angular', 'euclidean', 'manhattan', 'hamming', 'dot']
 
-    def init(self, 
-        n_trees: int=10, 
-        metric: str='angular', 
-        n_jobs: int=-1  # n_jobs=-1 Run over all CPU availables
+    def __newTree(
+        self,
+        metric: str
     ) -> None:
 
         #assert(metric in self.availables_metrics), f"Error: The value of the parameter 'metric' can only be {self.availables_metrics}!"
@@ -51,29 +64,138 @@ class Ann:
         if metric not in self.availables_metrics:
             raise ValueError(f"'metric' parameter possible values are {self.availables_metrics}")
 
-        print("\tInit tree...")
+        self.metric = metric
+        self.tree = AnnoyIndex(self.vectors.shape[1], metric=metric)
+
+    def build(
+        self,
+        n_trees: int=10,
+        metric: str='angular',
+        n_jobs: int=-1,
+        on_disk_path: str=None,
+        chunk_size: int=8192
+    ) -> None:
+
+        self.__newTree(metric)
+        self.n_trees = n_trees
+        if on_disk_path is not None:
+            self.tree.on_disk_build(on_disk_path)
+
+        # Annoy only takes one item at a time. Rows are converted to python
+        # lists by chunks, that annoy reads faster than numpy rows
         self.tt.start()
-        self.tree = AnnoyIndex(len(self.vectors[0]), metric=metric)
-        for i, v in tqdm(enumerate(self.vectors), total=len(self.vectors)):
-            self.tree.add_item(i, v)
-        self.tt.stop()
+        n_rows = self.vectors.shape[0]
+        for start in range(0, n_rows, chunk_size):
+            for i, v in enumerate(self.vectors[start:start + chunk_size].tolist(), start):
+                self.tree.add_item(i, v)
+            logger.debug("Added %d/%d items", min(start + chunk_size, n_rows), n_rows)
+        self.tt.stop(f"Init tree of {n_rows} items:")
 
-        print("\tBuild tree...")
         self.tt.start()
         self.tree.build(n_trees=n_trees, n_jobs=n_jobs)
-        self.tt.stop()
+        self.tt.stop(f"Build tree of {n_trees} trees:")
+
+    def save(
+        self,
+        index_path: str
+    ) -> None:
+
+        # Written aside and renamed, so that a half written forest is never loaded
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        self.tree.save(tmp_path)
+        os.replace(tmp_path, index_path)
+
+    def load(
+        self,
+        index_path: str,
+        metric: str='angular'
+    ) -> None:
+
+        self.__newTree(metric)
+        self.tt.start()
+        self.tree.load(index_path)  # mmaps the file
+        self.tt.stop(f"Load tree {index_path}:")
+
+    def __queryAll(
+        self,
+        queries: np.ndarray,
+        n_neighbors: int,
+        search_k: int
+    ) -> Tuple[List[List[int]], float]:
+
+        # Neighbors of each query, and the mean seconds by query
+        start = time.perf_counter()
+        ids_list = [
+            self.tree.get_nns_by_vector(query, n_neighbors, search_k=search_k)
+            for query in queries
+        ]
+        return ids_list, (time.perf_counter() - start) / len(queries)
+
+    def autotune(
+        self,
+        target_recall: float=0.95,
+        n_neighbors: int=10,
+        n_queries: int=200,
+        n_trees_grid: Tuple[int, ...]=(10, 20, 50, 100),
+        max_search_k_factor: int=32,
+        metric: str='angular',
+        n_jobs: int=-1,
+        seed: int=0
+    ) -> Dict[str, float]:
+
+        """Build the forest with the cheapest (n_trees, search_k) pair whose
+        recall@n_neighbors, against the exact neighbors of a sample of the
+        vectors, reaches target_recall.
+
+        Forests are tried from the smallest one, since build time and size
+        grow with n_trees, and for each of them search_k is doubled from
+        annoy default (n_trees * n_neighbors) until the target is met. If no
+        pair meets it, the one with the best recall is kept.
+        :return: The chosen n_trees and search_k, with their measured
+                 recall and mean seconds by query
+        """
+
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+        _, exact_ids = DotNeighbors(vectors).kneighbors(queries, n_neighbors)
+
+        best, best_tree = None, None
+        for n_trees in n_trees_grid:
+            self.build(n_trees, metric, n_jobs)
+
+            for factor in [2**i for i in range(int(np.log2(max_search_k_factor)) + 1)]:
+                search_k = n_trees * n_neighbors * factor
+                ids_list, seconds = self.__queryAll(queries, n_neighbors, search_k)
+                recall = float(np.mean([
+                    len(np.intersect1d(ids, exact)) / n_neighbors
+                    for ids, exact in zip(ids_list, exact_ids)
+                ]))
+                logger.info("n_trees=%d, search_k=%d: recall=%.4f, %.3fms", n_trees, search_k, recall, seconds * 1000)
+
+                if best is None or recall > best['recall']:
+                    best, best_tree = {
+                        'n_trees': n_trees,
+                        'search_k': search_k,
+                        'recall': recall,
+                        'seconds_by_query': seconds
+                    }, self.tree
+                if recall >= target_recall:
+                    break
+
+            if best['recall'] >= target_recall:
+                break
+
+        self.tree, self.n_trees, self.search_k = best_tree, best['n_trees'], best['search_k']
+        # Only rounded once chosen, the target is checked on the measured recall
+        return {**best, 'recall': round(best['recall'], 4)}
 
     def __getWordId(
         self, 
         word: str
     ) -> int:
 
-        word_id = None
-        try:
-            word_id = self.words.index(word)
-        except:
-            pass
-        return word_id
+        return self.word2id.get(word, None)
 
     def get(
         self, 
@@ -85,10 +207,58 @@ class Ann:
         neighbors_list = None
 
         if word_id != None:
-            neighbords_id = self.tree.get_nns_by_item(word_id, n_neighbors + 1)
+            neighbords_id = self.tree.get_nns_by_item(word_id, n_neighbors + 1, search_k=self.search_k)
             neighbors_list = [self.words[idx] for idx in neighbords_id][1:]
 
         else:
             print(f"The word '{word}' does not exist")
 
-        return neighbors_list
\ No newline at end of file
+        return neighbors_list
+
+    def get_many(
+        self,
+        words: List[str],
+        n_neighbors: int=10,
+        include_distances: bool=True
+    ) -> Union[Tuple[List[List[int]], List[List[float]]], List[List[int]]]:
+
+        """Get the n_neighbors nearest items of each word, the word included.
+        :return: The ids list of each word, and their distances list if
+                 include_distances. Both empty for unknown words
+        """
+
+        word_ids = []
+        for word in words:
+            word_id = self.word2id.get(word, None)
+            if word_id is None:
+                print(f"The word '{word}' does not exist")
+            word_ids.append(word_id)
+
+        return self.get_many_by_item(word_ids, n_neighbors, include_distances)
+
+    def get_many_by_item(
+        self,
+        word_ids: List[int],
+        n_neighbors: int=10,
+        include_distances: bool=True
+    ) -> Union[Tuple[List[List[int]], List[List[float]]], List[List[int]]]:
+
+        """Like get_many, for items already looked up. None ids get empty lists."""
+
+        get_nns = self.tree.get_nns_by_item
+        ids_list, distances_list = [], []
+
+        for word_id in word_ids:
+            ids, distances = [], []
+
+            if word_id is not None and include_distances:
+                ids, distances = get_nns(int(word_id), n_neighbors, self.search_k, True)
+            elif word_id is not None:
+                ids = get_nns(int(word_id), n_neighbors, self.search_k)
+
+            ids_list.append(ids)
+            distances_list.append(distances)
+
+        if include_distances:
+            return ids_list, distances_list
+        return ids_list
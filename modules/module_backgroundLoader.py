@@ -0,0 +1,164 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+
+class BackgroundResource:
+    """Builds a resource (Embedding, Vocabulary, LanguageModel, ...) on a
+    background thread, so the app can start serving while it loads.
+
+    Attribute access is forwarded to the loaded resource, waiting for it if
+    it is not ready yet. Callers that must not block can check isReady()
+    first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any
+    ) -> None:
+
+        self.name = name
+        self.error = None
+
+        self.__resource = None
+        self.__done = threading.Event()
+        self.__thread = threading.Thread(
+            target=self.__load,
+            args=(factory, args, kwargs),
+            name=f"load-{name}",
+            daemon=True
+        )
+        self.__thread.start()
+
+    def __load(
+        self,
+        factory: Callable[..., Any],
+        args: tuple,
+        kwargs: Dict[str, Any]
+    ) -> None:
+
+        try:
+            self.__resource = factory(*args, **kwargs)
+            print(f"The {self.name} is ready!")
+        except Exception as e:
+            self.error = e
+            print(f"Can't load the {self.name}: {e}")
+        finally:
+            self.__done.set()
+
+    def isReady(
+        self
+    ) -> bool:
+
+        return self.__done.is_set() and self.error is None
+
+    def status(
+        self
+    ) -> str:
+
+        if not self.__done.is_set():
+            return 'loading'
+        return 'ready' if self.error is None else 'failed'
+
+    def get(
+        self,
+        timeout: float=None
+    ) -> Any:
+
+        if not self.__done.wait(timeout):
+            raise TimeoutError(f"The {self.name} is still loading")
+        if self.error is not None:
+            raise RuntimeError(f"The {self.name} failed to load") from self.error
+        return self.__resource
+
+    def __getattr__(
+        self,
+        attr: str
+    ) -> Any:
+
+        # Own attributes missing means the object is not initialized yet
+        if attr.startswith('_BackgroundResource__'):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+    def __contains__(
+        self,
+        item: Any
+    ) -> bool:
+
+        return item in self.get()
+
+
+def is_ready(
+    resource: Any
+) -> bool:
+
+    """Whether a resource can be used, plain objects are always ready."""
+    if isinstance(resource, BackgroundResource):
+        return resource.isReady()
+    return True
+
+
+def is_failed(
+    resource: Any
+) -> bool:
+
+    """Whether a resource finished loading with an error."""
+    return isinstance(resource, BackgroundResource) and resource.status() == 'failed'
+
+
+def start_readiness_probe(
+    resources: Dict[str, BackgroundResource],
+    port: int,
+    host: str='0.0.0.0'
+) -> Optional[ThreadingHTTPServer]:
+
+    """Serve GET /ready on its own port: 200 once every resource is loaded,
+    503 while any of them is loading or failed. The body has each status.
+    A port that can't be bound only disables the probe, so the app is still
+    served, and None is returned.
+    """
+
+    class ReadinessHandler(BaseHTTPRequestHandler):
+        def do_GET(
+            self
+        ) -> None:
+
+            if self.path.rstrip('/') not in ('', '/ready'):
+                self.send_error(404)
+                return
+
+            statuses = {name: res.status() for name, res in resources.items()}
+            ready = all(status == 'ready' for status in statuses.values())
+            body = json.dumps({'ready': ready, 'resources': statuses}).encode('utf-8')
+
+            self.send_response(200 if ready else 503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(
+            self,
+            *args: Any
+        ) -> None:
+
+            # Probes are polled often, keep them out of the console
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), ReadinessHandler)
+    except OSError as e:
+        print(f"WARN: The readiness probe is disabled, can't bind port {port}: {e}")
+        return None
+
+    threading.Thread(
+        target=server.serve_forever,
+        name='readiness-probe',
+        daemon=True
+    ).start()
+    return server
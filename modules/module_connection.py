@@ -10,6 +10,7 @@ from modules.module_word2Context import Word2Context
 from modules.module_rankSents import RankSents
 from modules.module_crowsPairs import CrowsPairs
 from modules.module_ErrorManager import ErrorManager
+from modules.module_backgroundLoader import is_ready, is_failed
 
 
 class Connector(ABC):
@@ -26,6 +27,19 @@ class Connector(ABC):
                 path=f"modules/error_messages/{lang}.json"
             )
 
+    def check_ready(
+        self,
+        *resources: Any
+    ) -> str:
+
+        # A failed load won't become ready by retrying
+        if any(is_failed(resource) for resource in resources):
+            return self.errorManager.process(['RESOURCE_LOAD_FAILED'])
+        # Resources can still be loading in background when the app starts
+        if not all(is_ready(resource) for resource in resources):
+            return self.errorManager.process(['RESOURCE_NOT_READY'])
+        return ""
+
     def parse_word(
         self, 
         word: str
@@ -101,6 +115,7 @@ class WordExplorerConnector(Connector):
         Connector.__init__(self, kwargs.get('lang', 'en'))
         embedding = kwargs.get('embedding', None)
         self.logs_file_name = kwargs.get('logs_file_name', None)
+        self.nn_method = kwargs.get('nn_method', None)   # None to use the embedding one
         self.headers = [
             "word_list_to_diagnose",
             "word_list_1",
@@ -111,7 +126,8 @@ class WordExplorerConnector(Connector):
         
         if embedding is None:
             raise KeyError('embedding')
-        
+
+        self.embedding = embedding
         self.word_explorer = WordExplorer(
             embedding=embedding,
             errorManager=self.errorManager
@@ -134,8 +150,11 @@ class WordExplorerConnector(Connector):
         n_neighbors: int
     ) -> Tuple:
 
-        err = ""
-        neighbors_method = 'sklearn'
+        err = self.check_ready(self.embedding)
+        if err:
+            return None, err
+
+        neighbors_method = self.nn_method or self.embedding.nn_method
         wordlist_0 = self.parse_words(wordlist_0)
         wordlist_1 = self.parse_words(wordlist_1)
         wordlist_2 = self.parse_words(wordlist_2)
@@ -192,6 +211,7 @@ class BiasWordExplorerConnector(Connector):
 
         Connector.__init__(self, kwargs.get('lang', 'en'))
         embedding = kwargs.get('embedding', None)
+        self.vocabulary = kwargs.get('vocabulary', None)   # Only to filter the vocabulary ranking by frequency
         self.logs_file_name = kwargs.get('logs_file_name', None)
         self.headers = [
             "word_list_to_diagnose",
@@ -205,6 +225,7 @@ class BiasWordExplorerConnector(Connector):
         if embedding is None:
             raise KeyError('embedding')
 
+        self.embedding = embedding
         self.bias_word_explorer_2_spaces = WEBiasExplorer2Spaces(
             embedding=embedding,
             errorManager=self.errorManager
@@ -221,7 +242,10 @@ class BiasWordExplorerConnector(Connector):
         to_diagnose_list: str
     ) -> Tuple:
 
-        err = ""
+        err = self.check_ready(self.embedding)
+        if err:
+            return None, err
+
         wordlist_1 = self.parse_words(wordlist_1)
         wordlist_2 = self.parse_words(wordlist_2)
         to_diagnose_list = self.parse_words(to_diagnose_list)
@@ -266,7 +290,10 @@ class BiasWordExplorerConnector(Connector):
         to_diagnose_list: str
     ) -> Tuple:
 
-        err = ""
+        err = self.check_ready(self.embedding)
+        if err:
+            return None, err
+
         wordlist_1 = self.parse_words(wordlist_1)
         wordlist_2 = self.parse_words(wordlist_2)
         wordlist_3 = self.parse_words(wordlist_3)
@@ -306,6 +333,55 @@ class BiasWordExplorerConnector(Connector):
         
         return fig, err
 
+    def calculate_vocabulary_bias_2d(
+        self,
+        wordlist_1: str,
+        wordlist_2: str,
+        min_freq: float
+    ) -> Tuple:
+
+        min_freq = int(min_freq or 0)
+        vocabulary = self.vocabulary if min_freq > 0 else None
+
+        err = self.check_ready(self.embedding, vocabulary)
+        if err:
+            return None, err
+
+        wordlist_1 = self.parse_words(wordlist_1)
+        wordlist_2 = self.parse_words(wordlist_2)
+
+        word_lists = [wordlist_1, wordlist_2]
+        for _list in word_lists:
+            if not _list:
+                err = self.errorManager.process(['BIASEXPLORER_NOT_ENOUGH_WORD_2_KERNELS'])
+        if err:
+            return None, err
+
+        err = self.bias_word_explorer_2_spaces.check_oov(word_lists)
+        if err:
+            return None, err
+
+        # Save inputs in logs file
+        self.logs_save(
+            self.logs_file_name,
+            self.headers,
+            "",
+            wordlist_1,
+            wordlist_2,
+            "",
+            "",
+            f"vocabulary_min_freq_{min_freq}"
+        )
+
+        fig = self.bias_word_explorer_2_spaces.calculate_vocabulary_bias(
+            wordlist_1,
+            wordlist_2,
+            vocabulary=vocabulary,
+            min_freq=min_freq if vocabulary is not None else None
+        )
+
+        return fig, err
+
 class Word2ContextExplorerConnector(Connector):
     def __init__(
         self, 
@@ -326,6 +402,7 @@ class Word2ContextExplorerConnector(Connector):
         elif context is None:
             raise KeyError('context')
 
+        self.vocabulary = vocabulary
         self.word2context_explorer = Word2Context(
             context,
             vocabulary,
@@ -345,6 +422,10 @@ class Word2ContextExplorerConnector(Connector):
         word_cloud_plot = None
         subsets_choice = gr.CheckboxGroup.update(choices=[])
 
+        err = self.check_ready(self.vocabulary)
+        if err:
+            return err, contexts, subsets_info, distribution_plot, word_cloud_plot, subsets_choice
+
         err = self.word2context_explorer.errorChecking(word)
         if err:
             return err, contexts, subsets_info, distribution_plot, word_cloud_plot, subsets_choice
@@ -370,6 +451,10 @@ class Word2ContextExplorerConnector(Connector):
         err = ""
         contexts = pd.DataFrame([], columns=[''])
 
+        err = self.check_ready(self.vocabulary)
+        if err:
+            return err, contexts
+
         err = self.word2context_explorer.errorChecking(word)
         if err:
             return err, contexts
@@ -415,11 +500,23 @@ class PhraseBiasExplorerConnector(Connector):
         elif lang is None:
             raise KeyError('lang')
 
-        self.phrase_bias_explorer = RankSents(
-            language_model=language_model,
-            lang=lang,
-            errorManager=self.errorManager
-        )
+        self.language_model = language_model
+        self.lang = lang
+        self.__phrase_bias_explorer = None
+
+    @property
+    def phrase_bias_explorer(
+        self
+    ) -> RankSents:
+
+        # Built on first use, since it needs the language model to be loaded
+        if self.__phrase_bias_explorer is None:
+            self.__phrase_bias_explorer = RankSents(
+                language_model=self.language_model,
+                lang=self.lang,
+                errorManager=self.errorManager
+            )
+        return self.__phrase_bias_explorer
 
     def rank_sentence_options(
         self,
@@ -432,6 +529,10 @@ class PhraseBiasExplorerConnector(Connector):
         n_predictions: int=5
     ) -> Tuple:
 
+        err = self.check_ready(self.language_model)
+        if err:
+            return err, "", ""
+
         sent = " ".join(sent.strip().replace("*"," * ").split())
 
         err = self.phrase_bias_explorer.errorChecking(sent)
@@ -482,11 +583,22 @@ class CrowsPairsExplorerConnector(Connector):
 
         if language_model is None:
             raise KeyError('language_model')
-        
-        self.crows_pairs_explorer = CrowsPairs(
-            language_model=language_model,
-            errorManager=self.errorManager
-        )
+
+        self.language_model = language_model
+        self.__crows_pairs_explorer = None
+
+    @property
+    def crows_pairs_explorer(
+        self
+    ) -> CrowsPairs:
+
+        # Built on first use, since it needs the language model to be loaded
+        if self.__crows_pairs_explorer is None:
+            self.__crows_pairs_explorer = CrowsPairs(
+                language_model=self.language_model,
+                errorManager=self.errorManager
+            )
+        return self.__crows_pairs_explorer
 
     def compare_sentences(
         self,
@@ -498,6 +610,10 @@ class CrowsPairsExplorerConnector(Connector):
         sent5: str
     ) -> Tuple:
 
+        err = self.check_ready(self.language_model)
+        if err:
+            return err, "", ""
+
         sent_list = [sent0, sent1, sent2, sent3, sent4, sent5]
         err = self.crows_pairs_explorer.errorChecking(
             sent_list
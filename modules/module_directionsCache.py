@@ -0,0 +1,45 @@
+import weakref
+import numpy as np
+from modules.module_lruCache import LRUCache
+from typing import Any, Hashable, Optional
+
+
+class DirectionsCache(LRUCache):
+    """Thread-safe, size-bounded LRU cache of bias directions.
+
+    Entries are stored by a key that identifies the definitional word lists
+    and method, for a given embedding. The embedding is held by a weak
+    reference, so an entry is never served for another embedding that got
+    the id of a released one. Cached directions are read-only.
+    """
+
+    def __init__(
+        self,
+        max_size: int=128
+    ) -> None:
+
+        LRUCache.__init__(self, max_size)
+
+    def get(
+        self,
+        embedding: Any,
+        key: Hashable
+    ) -> Optional[np.ndarray]:
+
+        entry = self.lookup(
+            (id(embedding), key),
+            is_valid=lambda entry: entry[0]() is embedding
+        )
+        return entry[1] if entry is not None else None
+
+    def put(
+        self,
+        embedding: Any,
+        key: Hashable,
+        direction: np.ndarray
+    ) -> np.ndarray:
+
+        direction = np.array(direction)
+        direction.flags.writeable = False
+        self.store((id(embedding), key), (weakref.ref(embedding), direction))
+        return direction
@@ -0,0 +1,107 @@
+import numpy as np
+from typing import Tuple
+
+
+class DotNeighbors:
+    """Exact cosine nearest neighbors for unit-length vectors.
+
+    Since the rows of the matrix are normalized, the cosine similarity of a
+    query against the whole vocabulary is a single matrix product. The top-k
+    is then selected with argpartition, without any index to fit.
+
+    The matrix can also be a compressed one (float16, or int8 codes with
+    per-row scales). It is then scored by chunks, and the best candidates
+    can be re-ranked with the full precision vectors.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        chunk_size: int=None,
+        scales: np.ndarray=None,
+        rerank_vectors: np.ndarray=None,
+        rerank_factor: int=4
+    ) -> None:
+
+        self.vectors = vectors
+        self.chunk_size = chunk_size   # Rows scored at once, None to score all the matrix in one pass
+        self.scales = scales
+        self.rerank_vectors = rerank_vectors
+        self.rerank_factor = rerank_factor
+
+    def __topk(
+        self,
+        sims: np.ndarray,
+        k: int
+    ) -> np.ndarray:
+
+        # Unsorted indexes of the k greatest values of each row
+        if k >= sims.shape[1]:
+            return np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+        return np.argpartition(sims, -k, axis=1)[:, -k:]
+
+    def __scoreChunk(
+        self,
+        X: np.ndarray,
+        start: int,
+        stop: int
+    ) -> np.ndarray:
+
+        block = self.vectors[start:stop]
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+
+        sims = X @ block.T
+        if self.scales is not None:
+            sims *= self.scales[start:stop]
+        return sims
+
+    def kneighbors(
+        self,
+        X: np.ndarray,
+        n_neighbors: int=10
+    ) -> Tuple[np.ndarray, np.ndarray]:
+
+        """Find the n_neighbors most similar rows to each query.
+        :param np.ndarray X: (n_queries, d) matrix of normalized queries
+        :param int n_neighbors: Number of neighbors to return by query
+        :return: (n_queries, n_neighbors) similarities and ids, sorted by
+                 decreasing similarity
+        """
+
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        n_rows = self.vectors.shape[0]
+        k = min(n_neighbors, n_rows)
+        chunk_size = self.chunk_size or n_rows
+
+        # With re-ranking, more candidates are kept from the compressed scores
+        n_candidates = k
+        if self.rerank_vectors is not None:
+            n_candidates = min(k * self.rerank_factor, n_rows)
+
+        cand_ids, cand_sims = [], []
+        for start in range(0, n_rows, chunk_size):
+            sims = self.__scoreChunk(X, start, start + chunk_size)
+            ids = self.__topk(sims, n_candidates)
+            cand_sims.append(np.take_along_axis(sims, ids, axis=1))
+            cand_ids.append(ids + start)
+
+        cand_ids = np.concatenate(cand_ids, axis=1)
+        cand_sims = np.concatenate(cand_sims, axis=1)
+
+        # Merge the candidates of each chunk
+        best = self.__topk(cand_sims, n_candidates)
+        cand_ids = np.take_along_axis(cand_ids, best, axis=1)
+        cand_sims = np.take_along_axis(cand_sims, best, axis=1)
+
+        if self.rerank_vectors is not None:
+            cand_sims = np.einsum(
+                'qd,qkd->qk', X, np.asarray(self.rerank_vectors[cand_ids], dtype=np.float32)
+            )
+            best = self.__topk(cand_sims, k)
+            cand_ids = np.take_along_axis(cand_ids, best, axis=1)
+            cand_sims = np.take_along_axis(cand_sims, best, axis=1)
+
+        order = np.argsort(-cand_sims, axis=1, kind='stable')
+        return (np.take_along_axis(cand_sims, order, axis=1),
+                np.take_along_axis(cand_ids, order, axis=1))
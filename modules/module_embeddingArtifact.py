@@ -0,0 +1,257 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import List, Dict, Any, Tuple
+
+
+class EmbeddingArtifact:
+    """Versioned, binary cache of a prepared embedding.
+
+    The artifact is a directory placed next to the source embedding file
+    that holds one .npy file per array (so they can be memory-mapped and
+    shared through the page cache by several processes), the vocabulary
+    and a meta.json describing the source file it was built from.
+
+    Each limit and set of preparation params gets its own subdirectory,
+    so deployments that load the same file differently don't invalidate
+    each other's artifact and indexes.
+    """
+
+    VERSION = 1
+    META_FILE = 'meta.json'
+    WORDS_FILE = 'words.txt'
+
+    def __init__(
+        self,
+        source_path: str,
+        limit: int=None,
+        params: Dict[str, Any]=None,
+        artifact_dir: str=None
+    ) -> None:
+
+        self.source_path = source_path
+        self.limit = limit
+        self.params = params if params is not None else {}
+        self.artifact_dir = artifact_dir if artifact_dir is not None else os.path.join(
+            source_path + '.artifact', self.__variantName()
+        )
+
+        self.meta = None
+
+    def __variantName(
+        self
+    ) -> str:
+
+        params_hash = hashlib.sha256(json.dumps(self.params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return f"limit{self.limit if self.limit is not None else 'all'}_{params_hash}"
+
+    def __path(
+        self,
+        file_name: str
+    ) -> str:
+
+        return os.path.join(self.artifact_dir, file_name)
+
+    def __write(
+        self,
+        file_name: str,
+        write_fn
+    ) -> None:
+
+        # Write to a temporary file first, so that concurrent readers never
+        # see a partially written artifact
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        tmp_path = self.__path(f".{file_name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f_out:
+            write_fn(f_out)
+        os.replace(tmp_path, self.__path(file_name))
+
+    def __sourceHash(
+        self
+    ) -> str:
+
+        sha = hashlib.sha256()
+        with open(self.source_path, 'rb') as f_in:
+            for chunk in iter(lambda: f_in.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def __sourceStat(
+        self
+    ) -> Dict[str, int]:
+
+        stat = os.stat(self.source_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def readMeta(
+        self
+    ) -> Dict[str, Any]:
+
+        if self.meta is None:
+            meta_path = self.__path(self.META_FILE)
+            if os.path.isfile(meta_path):
+                with open(meta_path, 'r', encoding='utf-8') as f_in:
+                    self.meta = json.load(f_in)
+        return self.meta
+
+    def writeMeta(
+        self,
+        **extra: Any
+    ) -> None:
+
+        meta = self.readMeta() or {}
+        meta.update(extra)
+        self.__write(
+            self.META_FILE,
+            lambda f_out: f_out.write(json.dumps(meta, indent=2).encode('utf-8'))
+        )
+        self.meta = meta
+
+    def isValid(
+        self
+    ) -> bool:
+
+        meta = self.readMeta()
+        if meta is None or not os.path.isfile(self.source_path):
+            return False
+
+        if meta.get('version') != self.VERSION \
+            or meta.get('limit') != self.limit \
+            or meta.get('params') != self.params:
+            return False
+
+        # Unchanged size and mtime means the stored hash is still the
+        # source's hash. Otherwise re-hash, since a touched file may still
+        # have identical content
+        stat = self.__sourceStat()
+        if stat == meta.get('source_stat'):
+            return True
+
+        if meta.get('source_hash') != self.__sourceHash():
+            return False
+
+        # Only spares the next start the hashing, a read-only artifact is
+        # still valid
+        try:
+            self.writeMeta(source_stat=stat)
+        except OSError as e:
+            print(f"Can't update the embedding artifact meta in {self.artifact_dir}: {e}")
+        return True
+
+    def saveWords(
+        self,
+        words: List[str]
+    ) -> None:
+
+        self.__write(
+            self.WORDS_FILE,
+            lambda f_out: f_out.write('\n'.join(words).encode('utf-8'))
+        )
+
+    def loadWords(
+        self
+    ) -> np.ndarray:
+
+        # Read as bytes and split on '\n' only, as they were written, so
+        # that words holding other line breaks (e.g. '\r') stay whole
+        with open(self.__path(self.WORDS_FILE), 'rb') as f_in:
+            words = f_in.read().decode('utf-8').split('\n')
+        return np.array(words, dtype=object)
+
+    def hasArray(
+        self,
+        name: str
+    ) -> bool:
+
+        return os.path.isfile(self.__path(name + '.npy'))
+
+    def saveArray(
+        self,
+        name: str,
+        array: np.ndarray
+    ) -> None:
+
+        self.__write(
+            name + '.npy',
+            lambda f_out: np.save(f_out, np.ascontiguousarray(array), allow_pickle=False)
+        )
+
+    def loadArray(
+        self,
+        name: str,
+        mmap_mode: str='r'
+    ) -> np.ndarray:
+
+        return np.load(self.__path(name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+
+    def save(
+        self,
+        words: np.ndarray,
+        vectors: np.ndarray,
+        pca: np.ndarray
+    ) -> None:
+
+        # Invalidate any previous artifact of this variant (its source file
+        # changed), and drop the indexes derived from it
+        meta_path = self.__path(self.META_FILE)
+        if os.path.isfile(meta_path):
+            os.remove(meta_path)
+        if os.path.isdir(self.artifact_dir):
+            for file_name in os.listdir(self.artifact_dir):
+                if os.path.isfile(self.__path(file_name)):
+                    os.remove(self.__path(file_name))
+        self.meta = {}
+
+        self.saveWords(words)
+        self.saveArray('vectors', vectors)
+        self.saveArray('pca', pca)
+
+        # The meta file is written last, it is what marks the artifact as complete
+        self.writeMeta(
+            version=self.VERSION,
+            source=os.path.basename(self.source_path),
+            source_hash=self.__sourceHash(),
+            source_stat=self.__sourceStat(),
+            limit=self.limit,
+            params=self.params,
+            shape=list(vectors.shape)
+        )
+
+    def load(
+        self,
+        mmap_mode: str='r'
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+        words = self.loadWords()
+        vectors = self.loadArray('vectors', mmap_mode)
+        pca = self.loadArray('pca', mmap_mode)
+
+        if not len(words) == vectors.shape[0] == pca.shape[0]:
+            raise ValueError(f"The embedding artifact in {self.artifact_dir} is corrupted: "
+                             f"{len(words)} words for {vectors.shape[0]} vectors and {pca.shape[0]} pca rows")
+        return words, vectors, pca
+
+
+if __name__ == '__main__':
+    # Build step, e.g.:
+    #   $ python3 -m modules.module_embeddingArtifact data/100k_es_embedding.vec --limit 100000
+    import argparse
+    from modules.model_embbeding import Embedding
+
+    parser = argparse.ArgumentParser(description="Build the binary artifact of an embedding file")
+    parser.add_argument('path', type=str)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--randomizedPCA', action='store_true')
+    parser.add_argument('--knn-graph', action='store_true', help="Also precompute the neighbors of every word, for nn_method 'graph'")
+    parser.add_argument('--max-neighbors', type=int, default=20)
+    args = parser.parse_args()
+
+    Embedding(
+        path=args.path,
+        limit=args.limit,
+        randomizedPCA=args.randomizedPCA,
+        max_neighbors=args.max_neighbors,
+        nn_method='graph' if args.knn_graph else 'dot',
+        use_artifact=True
+    )
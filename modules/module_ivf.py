@@ -0,0 +1,223 @@
+import numpy as np
+from typing import Dict, Tuple
+
+
+class IVF:
+    """Inverted file index for cosine search over unit-length vectors.
+
+    A spherical k-means coarse quantizer splits the space in n_lists cells,
+    and each vector is stored in the inverted list of its nearest centroid.
+    A query only scores the vectors of its nprobe nearest cells.
+
+    With pq_m subquantizers, the residuals (vector - centroid) are also
+    product quantized to pq_m bytes per vector, and cells are scored with
+    lookup tables instead of the vectors. The best candidates are then
+    re-ranked with the full vectors.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        n_lists: int=None,
+        nprobe: int=8,
+        pq_m: int=None,
+        n_iter: int=10,
+        rerank_factor: int=4,
+        seed: int=0
+    ) -> None:
+
+        self.vectors = vectors
+        self.n_lists = n_lists if n_lists is not None else max(1, int(4 * np.sqrt(vectors.shape[0])))
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.n_iter = n_iter
+        self.rerank_factor = rerank_factor
+        self.seed = seed
+
+        if pq_m is not None and vectors.shape[1] % pq_m != 0:
+            raise ValueError(f"'pq_m: {pq_m}' parameter must divide the vectors dimension {vectors.shape[1]}")
+
+        self.centroids = None   # (n_lists, d) float32
+        self.order = None       # (V,) int32 vector ids, grouped by list
+        self.offsets = None     # (n_lists + 1,) int64 start of each list in order
+        self.codebooks = None   # (pq_m, 256, d / pq_m) float32
+        self.codes = None       # (V, pq_m) uint8 PQ codes, in the same order than order
+
+    def __kmeans(
+        self,
+        X: np.ndarray,
+        k: int,
+        rng: np.random.Generator,
+        spherical: bool
+    ) -> np.ndarray:
+
+        centroids = X[rng.choice(X.shape[0], size=k, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            assign = self.__assign(X, centroids, spherical)
+
+            # Sum of the points of each cluster through a sorted reduceat
+            order = np.argsort(assign, kind='stable')
+            labels, starts = np.unique(assign[order], return_index=True)
+            sums = np.add.reduceat(X[order], starts, axis=0)
+            counts = np.diff(np.append(starts, X.shape[0]))
+
+            new_centroids = X[rng.choice(X.shape[0], size=k)].copy()   # For the empty clusters
+            new_centroids[labels] = sums / counts[:, None]
+            if spherical:
+                norms = np.linalg.norm(new_centroids, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                new_centroids /= norms
+            centroids = new_centroids.astype(np.float32)
+
+        return centroids
+
+    def __assign(
+        self,
+        X: np.ndarray,
+        centroids: np.ndarray,
+        spherical: bool,
+        chunk_size: int=65536
+    ) -> np.ndarray:
+
+        # Nearest centroid by cosine, or by euclidean distance as
+        # argmax(x.c - |c|^2 / 2)
+        bias = 0 if spherical else (centroids ** 2).sum(axis=1) / 2
+        assign = np.empty(X.shape[0], dtype=np.int64)
+        for start in range(0, X.shape[0], chunk_size):
+            block = np.asarray(X[start:start + chunk_size], dtype=np.float32)
+            assign[start:start + chunk_size] = np.argmax(block @ centroids.T - bias, axis=1)
+        return assign
+
+    def __encode(
+        self,
+        ids: np.ndarray,
+        assign: np.ndarray
+    ) -> np.ndarray:
+
+        residuals = np.asarray(self.vectors[ids], dtype=np.float32) - self.centroids[assign]
+        sub_residuals = np.split(residuals, self.pq_m, axis=1)
+        return np.stack([
+            self.__assign(sub, codebook, spherical=False)
+            for sub, codebook in zip(sub_residuals, self.codebooks)
+        ], axis=1).astype(np.uint8)
+
+    def build(
+        self,
+        train_size: int=65536,
+        chunk_size: int=65536
+    ) -> None:
+
+        rng = np.random.default_rng(self.seed)
+        n_rows = self.vectors.shape[0]
+        n_lists = min(self.n_lists, n_rows)
+
+        sample_ids = np.sort(rng.choice(n_rows, size=min(n_rows, max(train_size, 4 * n_lists)), replace=False))
+        sample = np.asarray(self.vectors[sample_ids], dtype=np.float32)
+
+        # --- Coarse quantizer ---
+        self.centroids = self.__kmeans(sample, n_lists, rng, spherical=True)
+        assign = self.__assign(self.vectors, self.centroids, spherical=True)
+
+        self.order = np.argsort(assign, kind='stable').astype(np.int32)
+        self.offsets = np.searchsorted(assign[self.order], np.arange(n_lists + 1)).astype(np.int64)
+
+        # --- Product quantizer of the residuals ---
+        if self.pq_m is not None:
+            residuals = sample - self.centroids[self.__assign(sample, self.centroids, spherical=True)]
+            n_codes = min(256, sample.shape[0])
+            self.codebooks = np.stack([
+                self.__kmeans(np.ascontiguousarray(sub), n_codes, rng, spherical=False)
+                for sub in np.split(residuals, self.pq_m, axis=1)
+            ])
+
+            self.codes = np.empty((n_rows, self.pq_m), dtype=np.uint8)
+            for start in range(0, n_rows, chunk_size):
+                ids = self.order[start:start + chunk_size]
+                self.codes[start:start + chunk_size] = self.__encode(ids, assign[ids])
+
+    def arrays(
+        self
+    ) -> Dict[str, np.ndarray]:
+
+        """Arrays that make up the built index, to be serialized."""
+        arrays = {'centroids': self.centroids, 'order': self.order, 'offsets': self.offsets}
+        if self.pq_m is not None:
+            arrays.update({'codebooks': self.codebooks, 'codes': self.codes})
+        return arrays
+
+    def load(
+        self,
+        arrays: Dict[str, np.ndarray]
+    ) -> None:
+
+        self.centroids = np.asarray(arrays['centroids'])
+        self.order = arrays['order']
+        self.offsets = np.asarray(arrays['offsets'])
+        if self.pq_m is not None:
+            self.codebooks = np.asarray(arrays['codebooks'])
+            self.codes = arrays['codes']
+
+    def __search(
+        self,
+        q: np.ndarray,
+        lists: np.ndarray,
+        coarse_sims: np.ndarray,
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+
+        positions = np.concatenate([
+            np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists
+        ])
+        ids = np.asarray(self.order[positions], dtype=np.int64)
+
+        if self.pq_m is None:
+            sims = np.asarray(self.vectors[ids], dtype=np.float32) @ q
+            n_candidates = k
+        else:
+            # q.(c + r) = q.c + sum of the q sub-vectors dot their code
+            lut = np.einsum('mkd,md->mk', self.codebooks, q.reshape(self.pq_m, -1))
+            list_sizes = self.offsets[lists + 1] - self.offsets[lists]
+            sims = np.repeat(coarse_sims, list_sizes)
+            sims += lut[np.arange(self.pq_m), np.asarray(self.codes[positions], dtype=np.int64)].sum(axis=1)
+            n_candidates = k * self.rerank_factor
+
+        if n_candidates < len(ids):
+            best = np.argpartition(sims, -n_candidates)[-n_candidates:]
+            ids, sims = ids[best], sims[best]
+
+        if self.pq_m is not None:
+            sims = np.asarray(self.vectors[ids], dtype=np.float32) @ q
+
+        order = np.argsort(-sims, kind='stable')[:k]
+        return sims[order], ids[order]
+
+    def kneighbors(
+        self,
+        X: np.ndarray,
+        n_neighbors: int=10
+    ) -> Tuple[np.ndarray, np.ndarray]:
+
+        """Find the approximate n_neighbors most similar rows to each query.
+        :param np.ndarray X: (n_queries, d) matrix of normalized queries
+        :param int n_neighbors: Number of neighbors to return by query
+        :return: (n_queries, n_neighbors) similarities and ids, sorted by
+                 decreasing similarity. Rows are padded with -1 ids when the
+                 probed lists hold less than n_neighbors vectors
+        """
+
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+
+        # Coarse step for all the queries at once
+        coarse = X @ self.centroids.T
+        probes = np.argpartition(coarse, -nprobe, axis=1)[:, -nprobe:]
+
+        all_sims = np.full((X.shape[0], n_neighbors), -np.inf, dtype=np.float32)
+        all_ids = np.full((X.shape[0], n_neighbors), -1, dtype=np.int64)
+        for i, (q, lists) in enumerate(zip(X, probes)):
+            sims, ids = self.__search(q, lists, coarse[i, lists], n_neighbors)
+            all_sims[i, :len(ids)] = sims
+            all_ids[i, :len(ids)] = ids
+
+        return all_sims, all_ids
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache.
+
+    Subclasses build the keys and values of their own entries, and store
+    and look them up through store() and lookup(). A max_size of 0
+    disables the cache.
+    """
+
+    def __init__(
+        self,
+        max_size: int=1024
+    ) -> None:
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(
+        self
+    ) -> int:
+
+        return len(self.__entries)
+
+    def lookup(
+        self,
+        key: Hashable,
+        is_valid: Callable[[Any], bool]=None
+    ) -> Optional[Any]:
+
+        """The value stored by key, or None. Values rejected by is_valid
+        count as misses."""
+        with self.__lock:
+            value = self.__entries.get(key, None)
+            if value is None or (is_valid is not None and not is_valid(value)):
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def store(
+        self,
+        key: Hashable,
+        value: Any
+    ) -> None:
+
+        if self.max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def clear(
+        self
+    ) -> None:
+
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(
+        self
+    ) -> Dict[str, int]:
+
+        with self.__lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.__entries),
+                'max_size': self.max_size
+            }
@@ -0,0 +1,611 @@
+import os
+import json
+import tempfile
+import numpy as np
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.neighbors import NearestNeighbors
+from threadpoolctl import threadpool_limits
+from modules.module_ann import Ann
+from modules.module_dotNeighbors import DotNeighbors
+from modules.module_ivf import IVF
+from modules.module_embeddingArtifact import EmbeddingArtifact
+from modules.module_quantization import dequantize
+from typing import List, Dict, Any, Tuple, Type
+
+
+# Registered nearest neighbors backends, by nn_method name
+NN_BACKENDS: Dict[str, Type['NeighborsBackend']] = {}
+
+
+def register_backend(
+    name: str
+):
+
+    """Class decorator that makes a backend selectable as nn_method."""
+    def decorator(cls):
+        cls.name = name
+        NN_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def get_backend(
+    name: str
+) -> Type['NeighborsBackend']:
+
+    if name not in NN_BACKENDS:
+        raise ValueError(f"'nn method' parameter possible values are {list(NN_BACKENDS)}")
+    return NN_BACKENDS[name]
+
+
+def _resident_nbytes(
+    *arrays: np.ndarray
+) -> int:
+
+    # Memory mapped arrays are paged in from disk on demand, they don't count
+    return sum(
+        array.nbytes for array in arrays
+        if array is not None and not isinstance(array, np.memmap)
+    )
+
+
+class NeighborsBackend(ABC):
+    """Nearest neighbors search over the normalized embedding vectors.
+
+    A backend gets the (V, d) float32 matrix, or the stored one for the
+    backends with COMPRESSED set, which also get the int8 scales and the
+    full precision vectors to re-rank with. It is then either loaded from
+    the embedding artifact or built (and saved to it).
+
+    Queries return the cosine similarities and row ids of each query
+    neighbors, sorted by decreasing similarity.
+    """
+
+    name = None
+    COMPRESSED = False   # Whether it can score the compressed storage matrix
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: np.ndarray=None,
+        rerank_vectors: np.ndarray=None,
+        **params: Any
+    ) -> None:
+
+        self.vectors = vectors
+        self.scales = scales
+        self.rerank_vectors = rerank_vectors
+        self.params = params
+
+    @abstractmethod
+    def build(
+        self,
+        artifact: EmbeddingArtifact=None
+    ) -> None:
+
+        """Build the index. Backends that can build straight to disk may
+        do it in the artifact directory."""
+
+    def save(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> None:
+
+        """Persist the built index in the artifact, nothing by default."""
+
+    def load(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> bool:
+
+        """Load an index saved in the artifact.
+        :return: Whether it was found, otherwise it has to be built
+        """
+        return False
+
+    @abstractmethod
+    def batch_query(
+        self,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        """Neighbors of each row of the (n_queries, d) float32 matrix X.
+        :return: The similarities and ids arrays of each query
+        """
+
+    def query(
+        self,
+        x: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+
+        sims, ids = self.batch_query(np.atleast_2d(x), n_neighbors)
+        return sims[0], ids[0]
+
+    def batch_query_rows(
+        self,
+        ids: np.ndarray,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        """Neighbors of the vocabulary rows ids, whose vectors are X. By
+        default the vectors are queried."""
+        return self.batch_query(X, n_neighbors)
+
+    @abstractmethod
+    def memory_bytes(
+        self
+    ) -> int:
+
+        """Resident memory taken by the index, the vectors it keeps included."""
+
+
+@register_backend('sklearn')
+class SklearnBackend(NeighborsBackend):
+    """Exact search with sklearn NearestNeighbors."""
+
+    def build(
+        self,
+        artifact: EmbeddingArtifact=None
+    ) -> None:
+
+        print("Initializing sklearn method to search for nearby neighbors...")
+        self.neigh = NearestNeighbors(
+            n_neighbors=self.params.get('max_neighbors', 20)
+        )
+        self.neigh.fit(
+            X=self.vectors
+        )
+
+    def batch_query(
+        self,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        nn_dist, nn_ids = self.neigh.kneighbors(X, n_neighbors)
+        # Euclidean distance between unit vectors is sqrt(2 - 2cos)
+        return list(1 - nn_dist**2 / 2), list(nn_ids)
+
+    def memory_bytes(
+        self
+    ) -> int:
+
+        arrays = [self.neigh._fit_X]
+        if getattr(self.neigh, '_tree', None) is not None:
+            arrays += [array for array in self.neigh._tree.get_arrays() if isinstance(array, np.ndarray)]
+        return _resident_nbytes(*arrays)
+
+
+@register_backend('ann')
+class AnnBackend(NeighborsBackend):
+    """Approximate search with an Annoy forest, kept in the artifact.
+
+    With a target_recall, n_trees and search_k are auto-tuned to the
+    cheapest pair that meets it, and stored next to the saved forest.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: np.ndarray=None,
+        rerank_vectors: np.ndarray=None,
+        **params: Any
+    ) -> None:
+
+        NeighborsBackend.__init__(self, vectors, scales, rerank_vectors, **params)
+        self.n_trees = params.get('n_trees', 20)
+        self.search_k = params.get('search_k', -1)
+        self.metric = params.get('metric', 'dot')
+        self.on_disk_build = params.get('on_disk_build', False)
+        self.target_recall = params.get('target_recall', None)
+        self.tune_neighbors = params.get('tune_neighbors', 10)
+        self.index_path = None
+        self.tuning = None
+        self.forest_bytes = None
+
+        self.ann = Ann(
+            words=params.get('words', None),
+            vectors=vectors,
+            coord=params.get('coord', None)
+        )
+
+    def __fileName(
+        self
+    ) -> str:
+
+        if self.target_recall is not None:
+            return f"annoy_recall{self.target_recall}_{self.tune_neighbors}_{self.metric}.ann"
+        return f"annoy_{self.n_trees}_{self.metric}.ann"
+
+    def build(
+        self,
+        artifact: EmbeddingArtifact=None
+    ) -> None:
+
+        print("Initializing Annoy method to search for nearby neighbors...")
+        if self.target_recall is not None:
+            # Candidate forests are built in RAM, on_disk_build doesn't apply
+            self.tuning = self.ann.autotune(
+                target_recall=self.target_recall,
+                n_neighbors=self.tune_neighbors,
+                metric=self.metric
+            )
+            print(f"\tTuned to n_trees={self.ann.n_trees}, search_k={self.ann.search_k} (recall {self.tuning['recall']})")
+        elif self.on_disk_build and artifact is not None:
+            # Build straight into the file instead of RAM
+            os.makedirs(artifact.artifact_dir, exist_ok=True)
+            index_path = os.path.join(artifact.artifact_dir, self.__fileName())
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            self.ann.build(self.n_trees, self.metric, n_jobs=-1, on_disk_path=tmp_path)
+            os.replace(tmp_path, index_path)
+            self.index_path = index_path
+        else:
+            self.ann.build(self.n_trees, self.metric, n_jobs=-1)
+
+        if self.target_recall is None:
+            self.ann.search_k = self.search_k
+
+    def save(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> None:
+
+        if self.index_path is None:
+            os.makedirs(artifact.artifact_dir, exist_ok=True)
+            self.index_path = os.path.join(artifact.artifact_dir, self.__fileName())
+            self.ann.save(self.index_path)
+
+        # The search parameters the forest was built for
+        with open(self.index_path + '.json', 'w', encoding='utf-8') as f_out:
+            json.dump({
+                'n_trees': self.ann.n_trees,
+                'search_k': self.ann.search_k,
+                'metric': self.metric,
+                'target_recall': self.target_recall,
+                'tuning': self.tuning
+            }, f_out)
+
+    def load(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> bool:
+
+        index_path = os.path.join(artifact.artifact_dir, self.__fileName())
+        if not os.path.isfile(index_path):
+            return False
+
+        print("Initializing Annoy method to search for nearby neighbors...")
+        self.ann.load(index_path, self.metric)
+        self.index_path = index_path
+
+        self.ann.n_trees, self.ann.search_k = self.n_trees, self.search_k
+        if os.path.isfile(index_path + '.json'):
+            with open(index_path + '.json', encoding='utf-8') as f_in:
+                info = json.load(f_in)
+            self.ann.n_trees, self.tuning = info['n_trees'], info.get('tuning', None)
+            if self.target_recall is not None:
+                self.ann.search_k = info['search_k']
+        return True
+
+    def batch_query(
+        self,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        get_nns = self.ann.tree.get_nns_by_vector
+        results = [
+            get_nns(x, n_neighbors, self.ann.search_k, True)
+            for x in np.asarray(X, dtype=np.float32).tolist()
+        ]
+        return self.__toSimilarities(*zip(*results)) if results else ([], [])
+
+    def batch_query_rows(
+        self,
+        ids: np.ndarray,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        # Vocabulary rows are items of the forest, queried by id without
+        # converting their vectors
+        ids_list, distances_list = self.ann.get_many_by_item(ids, n_neighbors, include_distances=True)
+        return self.__toSimilarities(ids_list, distances_list)
+
+    def __toSimilarities(
+        self,
+        ids_list: List[List[int]],
+        distances_list: List[List[float]]
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        sims_list = []
+        for dist in distances_list:
+            dist = np.array(dist, dtype=np.float32)
+            if self.metric != 'dot':
+                # Angular distance between unit vectors is sqrt(2 - 2cos)
+                dist = 1 - dist**2 / 2
+            sims_list.append(dist)
+
+        return sims_list, [np.array(ids, dtype=np.int64) for ids in ids_list]
+
+    def memory_bytes(
+        self
+    ) -> int:
+
+        # A saved forest is memory mapped, only its size is known
+        if self.index_path is not None:
+            return os.path.getsize(self.index_path)
+
+        # Otherwise, the forest built in RAM is measured by writing it to a
+        # temporary file. Annoy maps the written file back instead of the RAM
+        # copy, which keeps its nodes after the file is removed
+        if self.forest_bytes is None:
+            fd, tmp_path = tempfile.mkstemp(suffix='.ann')
+            os.close(fd)
+            try:
+                self.ann.tree.save(tmp_path)
+                self.forest_bytes = os.path.getsize(tmp_path)
+            finally:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return self.forest_bytes
+
+
+@register_backend('dot')
+class DotBackend(NeighborsBackend):
+    """Exact search as a matrix product over the normalized vectors."""
+
+    COMPRESSED = True
+
+    def build(
+        self,
+        artifact: EmbeddingArtifact=None
+    ) -> None:
+
+        print("Initializing dot method to search for nearby neighbors...")
+        chunk_size = self.params.get('chunk_size', None)
+        if chunk_size is None and self.vectors.dtype != np.float32:
+            # Compressed matrices are scored by chunks converted to float32
+            chunk_size = 65536
+
+        self.dot = DotNeighbors(
+            vectors=self.vectors,
+            chunk_size=chunk_size,
+            scales=self.scales,
+            rerank_vectors=self.rerank_vectors
+        )
+
+    def batch_query(
+        self,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        nn_sims, nn_ids = self.dot.kneighbors(X, n_neighbors)
+        return list(nn_sims), list(nn_ids)
+
+    def memory_bytes(
+        self
+    ) -> int:
+
+        return _resident_nbytes(self.vectors, self.scales, self.rerank_vectors)
+
+
+@register_backend('ivf')
+class IvfBackend(NeighborsBackend):
+    """Approximate search with an inverted file index, optionally product
+    quantized, kept in the artifact."""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: np.ndarray=None,
+        rerank_vectors: np.ndarray=None,
+        **params: Any
+    ) -> None:
+
+        NeighborsBackend.__init__(self, vectors, scales, rerank_vectors, **params)
+        self.ivf = IVF(
+            vectors=vectors,
+            **params
+        )
+
+    def __arrayNames(
+        self
+    ) -> List[str]:
+
+        # Named after the parameters that change the index. nprobe only
+        # affects the queries
+        key = f"ivf_{self.ivf.n_lists}_{self.ivf.pq_m}_{self.ivf.n_iter}_{self.ivf.seed}"
+        names = ['centroids', 'order', 'offsets']
+        if self.ivf.pq_m is not None:
+            names += ['codebooks', 'codes']
+        return [(name, f"{key}_{name}") for name in names]
+
+    def build(
+        self,
+        artifact: EmbeddingArtifact=None
+    ) -> None:
+
+        print("Initializing IVF method to search for nearby neighbors...")
+        self.ivf.build()
+
+    def save(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> None:
+
+        arrays = self.ivf.arrays()
+        for name, array_name in self.__arrayNames():
+            artifact.saveArray(array_name, arrays[name])
+
+    def load(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> bool:
+
+        names = self.__arrayNames()
+        if not all(artifact.hasArray(array_name) for _, array_name in names):
+            return False
+
+        print("Initializing IVF method to search for nearby neighbors...")
+        self.ivf.load({
+            name: artifact.loadArray(array_name, mmap_mode='r')
+            for name, array_name in names
+        })
+        return True
+
+    def batch_query(
+        self,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        nn_sims, nn_ids = self.ivf.kneighbors(X, n_neighbors)
+        # Rows are padded with -1 when the probed lists are too small
+        found = nn_ids >= 0
+        return ([sims[mask] for sims, mask in zip(nn_sims, found)],
+                [ids[mask] for ids, mask in zip(nn_ids, found)])
+
+    def memory_bytes(
+        self
+    ) -> int:
+
+        return _resident_nbytes(self.vectors, *self.ivf.arrays().values())
+
+
+@register_backend('graph')
+class GraphBackend(DotBackend):
+    """Precomputed neighbors of every vocabulary word, kept in the artifact.
+
+    The top max_neighbors ids (int32) and similarities (float16) of each
+    row are computed once, by blocks of rows scored in parallel, and memory
+    mapped afterwards. Vocabulary queries are then a row slice, with no
+    index in memory. Other vectors are searched exactly with the dot method.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: np.ndarray=None,
+        rerank_vectors: np.ndarray=None,
+        **params: Any
+    ) -> None:
+
+        DotBackend.__init__(self, vectors, scales, rerank_vectors, **params)
+        # The row itself is one of its neighbors, so one more is kept
+        self.n_columns = params.get('max_neighbors', 20) + 1
+        self.block_size = params.get('block_size', 256)
+        self.n_jobs = params.get('n_jobs', None) or os.cpu_count() or 1   # None for all the cpus
+        self.knn_ids = None
+        self.knn_sims = None
+
+    def __arrayNames(
+        self
+    ) -> Tuple[str, str]:
+
+        # Graphs scored on compressed vectors differ from the float32 one,
+        # they are kept apart by storage and re-rank mode
+        prefix = f"knn_{self.n_columns}"
+        if self.scales is not None or self.vectors.dtype != np.float32:
+            prefix += f"_{self.vectors.dtype.name}" + ('_rerank' if self.rerank_vectors is not None else '')
+        return f"{prefix}_ids", f"{prefix}_sims"
+
+    def __queryRows(
+        self,
+        start: int,
+        stop: int
+    ) -> np.ndarray:
+
+        if self.rerank_vectors is not None:
+            return np.asarray(self.rerank_vectors[start:stop], dtype=np.float32)
+        scales = self.scales[start:stop] if self.scales is not None else None
+        return dequantize(self.vectors[start:stop], scales)
+
+    def build(
+        self,
+        artifact: EmbeddingArtifact=None
+    ) -> None:
+
+        DotBackend.build(self, artifact)
+        print("Computing the nearest neighbors graph of the vocabulary...")
+
+        # Chunked scoring bounds the memory of each block to
+        # block_size x chunk_size similarities (and their argpartition). The
+        # chunks shrink with the threads, so that all of them together hold
+        # about as much as a single 65536 rows chunk
+        n_workers = min(self.n_jobs, os.cpu_count() or 1)
+        dot = DotNeighbors(
+            vectors=self.vectors,
+            chunk_size=max(4096, 65536 // n_workers),
+            scales=self.scales,
+            rerank_vectors=self.rerank_vectors
+        )
+
+        n_rows = self.vectors.shape[0]
+        k = min(self.n_columns, n_rows)
+        self.knn_ids = np.full((n_rows, self.n_columns), -1, dtype=np.int32)
+        self.knn_sims = np.full((n_rows, self.n_columns), -np.inf, dtype=np.float16)
+
+        def fill_block(start: int) -> None:
+            stop = min(start + self.block_size, n_rows)
+            sims, ids = dot.kneighbors(self.__queryRows(start, stop), k)
+            self.knn_ids[start:stop, :k] = ids
+            self.knn_sims[start:stop, :k] = sims
+
+        # Matrix products release the GIL, so blocks run in parallel threads,
+        # each with a single BLAS thread so that cpus aren't oversubscribed
+        with threadpool_limits(limits=1 if n_workers > 1 else None, user_api='blas'), \
+                ThreadPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(fill_block, range(0, n_rows, self.block_size)))
+
+    def save(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> None:
+
+        ids_name, sims_name = self.__arrayNames()
+        artifact.saveArray(ids_name, self.knn_ids)
+        artifact.saveArray(sims_name, self.knn_sims)
+
+    def load(
+        self,
+        artifact: EmbeddingArtifact
+    ) -> bool:
+
+        ids_name, sims_name = self.__arrayNames()
+        if not (artifact.hasArray(ids_name) and artifact.hasArray(sims_name)):
+            return False
+
+        DotBackend.build(self, artifact)
+        self.knn_ids = artifact.loadArray(ids_name, mmap_mode='r')
+        self.knn_sims = artifact.loadArray(sims_name, mmap_mode='r')
+        return True
+
+    def batch_query_rows(
+        self,
+        ids: np.ndarray,
+        X: np.ndarray,
+        n_neighbors: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+
+        if n_neighbors > self.n_columns:
+            return self.batch_query(X, n_neighbors)
+
+        nn_ids = np.asarray(self.knn_ids[ids, :n_neighbors], dtype=np.int64)
+        nn_sims = np.asarray(self.knn_sims[ids, :n_neighbors], dtype=np.float32)
+        found = nn_ids >= 0
+        return ([sims[mask] for sims, mask in zip(nn_sims, found)],
+                [row_ids[mask] for row_ids, mask in zip(nn_ids, found)])
+
+    def memory_bytes(
+        self
+    ) -> int:
+
+        return DotBackend.memory_bytes(self) + _resident_nbytes(self.knn_ids, self.knn_sims)
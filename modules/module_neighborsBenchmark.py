@@ -0,0 +1,153 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+from modules.module_neighborsBackends import NN_BACKENDS, get_backend
+from modules.module_dotNeighbors import DotNeighbors
+from typing import List, Dict, Any
+
+
+def synthetic_vectors(
+    n_rows: int,
+    dim: int,
+    n_clusters: int=100,
+    noise: float=0.5,
+    seed: int=0
+) -> np.ndarray:
+
+    """Normalized vectors drawn around random centers, so that they have
+    neighborhoods like an embedding instead of being uniformly spread."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    vectors = centers[rng.integers(0, n_clusters, n_rows)] + noise * rng.normal(size=(n_rows, dim))
+    vectors = vectors.astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def recall_at_k(
+    ids_list: List[np.ndarray],
+    exact_ids: np.ndarray
+) -> float:
+
+    """Mean fraction of the exact neighbors of each query that were found."""
+    k = exact_ids.shape[1]
+    return float(np.mean([
+        len(np.intersect1d(ids[:k], exact)) / k
+        for ids, exact in zip(ids_list, exact_ids)
+    ]))
+
+
+def run_benchmark(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    n_neighbors: int=10,
+    backends: List[str]=None,
+    backends_params: Dict[str, Dict[str, Any]]=None
+) -> List[Dict[str, Any]]:
+
+    """Build each backend over vectors and run the queries through it.
+    :param np.ndarray vectors: (V, d) float32 matrix of normalized vectors
+    :param np.ndarray queries: (n_queries, d) float32 matrix of normalized queries
+    :param int n_neighbors: The k of recall@k
+    :param list backends: Names of the backends to run, all the registered ones by default
+    :param dict backends_params: Extra parameters of each backend, by name
+    :return: A row of results by backend
+    """
+
+    backends = backends or list(NN_BACKENDS)
+    backends_params = backends_params or {}
+    _, exact_ids = DotNeighbors(vectors).kneighbors(queries, n_neighbors)
+
+    results = []
+    for name in backends:
+        params = {'max_neighbors': n_neighbors} if name == 'sklearn' else {}
+        params.update(backends_params.get(name, {}))
+        backend = get_backend(name)(vectors, **params)
+
+        start = time.perf_counter()
+        backend.build()
+        build_time = time.perf_counter() - start
+
+        # Latency of one query at a time, as the interface asks them
+        latencies, ids_list = [], []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = backend.query(query, n_neighbors)
+            latencies.append(time.perf_counter() - start)
+            ids_list.append(ids)
+
+        start = time.perf_counter()
+        backend.batch_query(queries, n_neighbors)
+        batch_time = time.perf_counter() - start
+
+        p50, p95, p99 = (float(p) for p in np.percentile(latencies, [50, 95, 99]) * 1000)
+        results.append({
+            'backend': name,
+            'build_s': round(build_time, 3),
+            'memory_mb': round(backend.memory_bytes() / 2**20, 2),
+            'p50_ms': round(p50, 3),
+            'p95_ms': round(p95, 3),
+            'p99_ms': round(p99, 3),
+            'batch_qps': round(len(queries) / batch_time, 1),
+            f'recall@{n_neighbors}': round(recall_at_k(ids_list, exact_ids), 4)
+        })
+
+    return results
+
+
+if __name__ == '__main__':
+    # Offline benchmark, e.g.:
+    #   $ python3 -m modules.module_neighborsBenchmark --rows 100000 --dim 300 --output bench.json
+    #   $ python3 -m modules.module_neighborsBenchmark --path data/100k_es_embedding.vec --backends ann ivf
+    import argparse
+    from modules.model_embbeding import Embedding
+
+    parser = argparse.ArgumentParser(description="Recall and latency of the nearest neighbors backends")
+    parser.add_argument('--path', type=str, default=None, help="Embedding to load, synthetic vectors if not given")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--rows', type=int, default=100000, help="Number of synthetic vectors")
+    parser.add_argument('--dim', type=int, default=300, help="Dimension of the synthetic vectors")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--backends', type=str, nargs='+', default=None, choices=list(NN_BACKENDS))
+    parser.add_argument('--params', type=json.loads, default=None, help="JSON of each backend parameters, e.g. '{\"ivf\": {\"nprobe\": 16}}'")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.path is None:
+        # Queries are held out of the indexed vectors
+        vectors = synthetic_vectors(args.rows + args.queries, args.dim, seed=args.seed)
+        vectors, queries = vectors[:args.rows], vectors[args.rows:]
+        source = f"synthetic {args.rows}x{args.dim}"
+    else:
+        embedding = Embedding(
+            path=args.path,
+            limit=args.limit,
+            nn_method='dot'
+        )
+        vectors = np.ascontiguousarray(embedding.vectors, dtype=np.float32)
+        queries = vectors[rng.choice(vectors.shape[0], size=min(args.queries, vectors.shape[0]), replace=False)]
+        source = args.path
+
+    results = run_benchmark(
+        vectors,
+        queries,
+        n_neighbors=args.k,
+        backends=args.backends,
+        backends_params=args.params
+    )
+
+    print(f"\n{source}, {len(queries)} queries, k={args.k}")
+    print(pd.DataFrame(results).to_string(index=False))
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f_out:
+            json.dump({
+                'source': source,
+                'n_queries': len(queries),
+                'k': args.k,
+                'results': results
+            }, f_out, indent=2)
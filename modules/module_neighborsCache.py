@@ -0,0 +1,47 @@
+import numpy as np
+from modules.module_lruCache import LRUCache
+from typing import List, Tuple, Optional
+
+
+class NeighborsCache(LRUCache):
+    """Thread-safe, size-bounded LRU cache of nearest neighbors queries.
+
+    Entries are stored by (word, nn_method) together with the number of
+    neighbors they were computed with, so a query for any k lower or equal
+    than the cached one is served from the same entry by slicing.
+    """
+
+    def __init__(
+        self,
+        max_size: int=1024
+    ) -> None:
+
+        LRUCache.__init__(self, max_size)
+
+    def get(
+        self,
+        word: str,
+        n_neighbors: int,
+        nn_method: str
+    ) -> Optional[Tuple[List[str], np.ndarray]]:
+
+        entry = self.lookup(
+            (word, nn_method),
+            is_valid=lambda entry: entry[0] >= n_neighbors
+        )
+        if entry is None:
+            return None
+
+        _, neighbors, similarities = entry
+        return neighbors[:n_neighbors], similarities[:n_neighbors]
+
+    def put(
+        self,
+        word: str,
+        n_neighbors: int,
+        nn_method: str,
+        neighbors: List[str],
+        similarities: np.ndarray
+    ) -> None:
+
+        self.store((word, nn_method), (n_neighbors, neighbors, similarities))
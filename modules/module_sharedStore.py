@@ -0,0 +1,184 @@
+import json
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, Optional
+
+
+class SharedEmbeddingStore:
+    """Embedding arrays placed in a named shared memory segment.
+
+    A loader process creates the segment once, and every serving process
+    attaches to it, so all of them read the same physical copy of the
+    vectors and PCA coordinates. Attached arrays are read-only views.
+
+    Segment layout: an 8 bytes header length, a JSON header with the name,
+    dtype, shape and offset of each array, then the arrays themselves,
+    aligned to 64 bytes. The vocabulary is stored as a '\\n' joined utf-8
+    blob.
+    """
+
+    ALIGN = 64
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        header: Dict,
+        owner: bool
+    ) -> None:
+
+        self.shm = shm
+        self.header = header
+        self.owner = owner
+        self.arrays = {}
+
+        for name, info in header['arrays'].items():
+            array = np.ndarray(
+                shape=tuple(info['shape']),
+                dtype=np.dtype(info['dtype']),
+                buffer=shm.buf,
+                offset=info['offset']
+            )
+            array.flags.writeable = False
+            self.arrays[name] = array
+
+    @classmethod
+    def __align(
+        cls,
+        offset: int
+    ) -> int:
+
+        return -(-offset // cls.ALIGN) * cls.ALIGN
+
+    @classmethod
+    def create(
+        cls,
+        name: str,
+        words: np.ndarray,
+        arrays: Dict[str, np.ndarray],
+        **meta
+    ) -> 'SharedEmbeddingStore':
+
+        """Copy words and arrays into a new segment. The caller owns it, and
+        detach() also unlinks it when serving is over."""
+
+        arrays = dict(arrays)
+        arrays['words'] = np.frombuffer('\n'.join(words).encode('utf-8'), dtype=np.uint8)
+
+        # Offsets depend on the header length, that depends on the offsets.
+        # Reserving a fixed size for the header breaks the cycle
+        header_size = 4096
+        header = {'meta': meta, 'arrays': {}}
+        offset = header_size
+        for array_name, array in arrays.items():
+            offset = cls.__align(offset)
+            header['arrays'][array_name] = {
+                'dtype': array.dtype.str,
+                'shape': list(array.shape),
+                'offset': offset
+            }
+            offset += array.nbytes
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        if len(header_bytes) + 8 > header_size:
+            raise ValueError("Too many arrays to fit in the shared memory header")
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+        shm.buf[:8] = len(header_bytes).to_bytes(8, 'little')
+        shm.buf[8:8 + len(header_bytes)] = header_bytes
+        for array_name, array in arrays.items():
+            info = header['arrays'][array_name]
+            target = np.ndarray(array.shape, array.dtype, buffer=shm.buf, offset=info['offset'])
+            target[...] = array
+            del target
+
+        return cls(shm, header, owner=True)
+
+    @classmethod
+    def attach(
+        cls,
+        name: str
+    ) -> 'SharedEmbeddingStore':
+
+        """Attach, read-only, to a segment created by another process."""
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before python 3.13 attaching registers the segment in the
+            # resource tracker, that would unlink it when this process exits
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+        header_len = int.from_bytes(bytes(shm.buf[:8]), 'little')
+        header = json.loads(bytes(shm.buf[8:8 + header_len]).decode('utf-8'))
+        return cls(shm, header, owner=False)
+
+    @property
+    def meta(
+        self
+    ) -> Dict:
+
+        return self.header['meta']
+
+    def words(
+        self
+    ) -> np.ndarray:
+
+        blob = self.arrays['words'].tobytes().decode('utf-8')
+        return np.array(blob.split('\n'), dtype=object)
+
+    def get(
+        self,
+        name: str
+    ) -> Optional[np.ndarray]:
+
+        return self.arrays.get(name, None)
+
+    def detach(
+        self
+    ) -> None:
+
+        """Release this process mapping. Views returned by get() must not be
+        used after it."""
+        if self.shm is None:
+            return
+        self.arrays.clear()
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views on the buffer are still alive, the mapping is released
+            # when the process exits
+            pass
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+if __name__ == '__main__':
+    # Loader process, e.g.:
+    #   $ python3 -m modules.module_sharedStore data/100k_es_embedding.vec --name edia_es --limit 100000
+    # Serving processes then use Embedding(..., shared_memory_name='edia_es')
+    import signal
+    import argparse
+    from modules.model_embbeding import Embedding
+
+    parser = argparse.ArgumentParser(description="Load an embedding into a named shared memory segment")
+    parser.add_argument('path', type=str)
+    parser.add_argument('--name', type=str, required=True)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--storage', type=str, default='float32')
+    args = parser.parse_args()
+
+    embedding = Embedding(
+        path=args.path,
+        limit=args.limit,
+        nn_method='dot',
+        storage=args.storage
+    )
+    store = embedding.shareMemory(args.name)
+    print(f"Serving {args.path} in the '{args.name}' shared memory segment...")
+
+    try:
+        signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT, signal.SIGTERM])
+        signal.sigwait([signal.SIGINT, signal.SIGTERM])
+    finally:
+        store.detach()
@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pandas as pd
 from typing import List, Dict, Tuple
 
@@ -18,6 +19,9 @@ class Vocabulary:
         # Minimal list with (percentile,freq) tuples to be able to plot the word distribution graph
         self.histogram = None
 
+        # Word -> freq series, built when first needed
+        self.__freqs = None
+
         # Load vocabulary dataset
         self.__load()
 
@@ -77,6 +81,23 @@ class Vocabulary:
 
         return self.__getValue(word, 'freq')
 
+    def getFreqs(
+        self,
+        words: List[str]
+    ) -> np.ndarray:
+
+        """Frequency of each word with a single lookup, 0 for the words
+        out of the vocabulary."""
+        if self.__freqs is None:
+            self.__freqs = (self.df_vocab
+                            .drop_duplicates('word')
+                            .set_index('word')['freq'])
+
+        return (self.__freqs
+                .reindex(words)
+                .fillna(0)
+                .to_numpy(dtype=np.int64))
+
     def getPercentile(
         self, 
         word:str
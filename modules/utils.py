@@ -2,7 +2,7 @@ import numpy as np
 import pandas as pd
 import pytz
 from datetime import datetime
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Callable
 
 
 
@@ -83,6 +83,29 @@ def cosine_similarity(
     similarity = v @ u / (v_norm * u_norm)
     return similarity
 
+def cosine_similarities(
+    matrix: np.ndarray,
+    v: np.ndarray
+) -> np.ndarray:
+
+    """Calculate the cosine similarity of each row of a matrix with a vector,
+    or with each column of a (d, k) matrix of vectors."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    v = np.asarray(v, dtype=np.float32)
+    norms = np.multiply.outer(np.sqrt(np.einsum('ij,ij->i', matrix, matrix)), np.linalg.norm(v, axis=0))
+    norms[norms == 0] = 1
+    return (matrix @ v) / norms
+
+def vectorized_projection(
+    func: Callable[[np.ndarray, np.ndarray], np.ndarray]
+) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+
+    """Mark a bias explorer projection_func as vectorized: it gets the
+    (n, d) matrix of the words vectors and the direction, and returns the
+    (n,) array of projections, instead of being called word by word."""
+    func.vectorized = True
+    return func
+
 
 def axes_labels_format(
     left: str, 